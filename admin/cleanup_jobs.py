@@ -0,0 +1,157 @@
+# admin/cleanup_jobs.py
+import fcntl
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from supabase_client import supabase, quote_filter_value
+from admin import visit_stats
+from admin.jobs import JOB_DIR, create_job, update_job
+from admin.table_query import order_column
+
+# Ids travel in the DELETE URL as id=in.(...); 100 uuids keep it near 4 KB (500 got 414s)
+DELETE_BATCH_SIZE = 100
+
+# Retention policy: rows older than N days are removed by the scheduler (0 = keep forever)
+RETENTION_DAYS = {
+    "visits": int(os.getenv("VISITS_RETENTION_DAYS", "0")),
+    "user_activity": int(os.getenv("USER_ACTIVITY_RETENTION_DAYS", "0")),
+}
+RETENTION_INTERVAL = 24 * 60 * 60
+
+CLEANABLE_TABLES = set(RETENTION_DAYS)
+MY_TZ = ZoneInfo("Asia/Kuala_Lumpur")
+
+
+def _agent_filter(agents, patterns, regex):
+    """PostgREST or= expression matching any listed agent or signature."""
+    parts = []
+    exact = [a for a in agents if a != visit_stats.EMPTY_AGENT]
+    if exact:
+        parts.append(f"user_agent.in.({','.join(quote_filter_value(a) for a in exact)})")
+    if visit_stats.EMPTY_AGENT in agents:
+        parts.append("user_agent.is.null")
+        parts.append('user_agent.eq.""')
+    for p in patterns:
+        if regex:
+            parts.append(f"user_agent.imatch.{quote_filter_value(p)}")
+        else:
+            parts.append(f"user_agent.ilike.{quote_filter_value('*' + p + '*')}")
+    return ",".join(parts)
+
+
+def _matching_ids(table, agent_filter, since, until):
+    col = order_column(table)
+    query = supabase.table(table).select("id")
+    if agent_filter:
+        query = query.or_(agent_filter)
+    if since:
+        query = query.gte(col, since)
+    if until:
+        query = query.lt(col, until)
+    return [r["id"] for r in query.limit(DELETE_BATCH_SIZE).execute().data or []]
+
+
+def run_cleanup(job, table, agents=(), patterns=(), regex=False, since=None, until=None):
+    """Delete matching rows in batches of DELETE_BATCH_SIZE, recording progress on the job."""
+    agent_filter = _agent_filter(agents, patterns, regex) if table == "visits" else ""
+    update_job(job, status="running")
+    deleted = 0
+    try:
+        while True:
+            ids = _matching_ids(table, agent_filter, since, until)
+            if not ids:
+                break
+            resp = supabase.table(table).delete().in_("id", ids).execute()
+            if not resp.data:
+                # Nothing removed (e.g. RLS); stop instead of re-selecting the same ids forever
+                raise RuntimeError("delete affected no rows")
+            deleted += len(resp.data)
+            update_job(job, deleted=deleted)
+        update_job(job, status="done", deleted=deleted)
+    except Exception as e:
+        print(f"[CLEANUP JOB] {job['id']} failed: {e}")
+        update_job(job, status="failed", error=str(e), deleted=deleted)
+    finally:
+        if table == "visits":
+            visit_stats.invalidate()
+
+
+def start_cleanup_job(table, agents=(), patterns=(), regex=False, since=None, until=None):
+    """
+    Queue a background cleanup. Needs at least one agent/pattern or a date bound,
+    so an empty form can never wipe a table. Returns the job id.
+    """
+    if table not in CLEANABLE_TABLES:
+        raise ValueError(f"Cleanup is not allowed on {table}")
+    if table != "visits" and (agents or patterns):
+        raise ValueError("Agent filters only apply to visits")
+    if not (agents or patterns or since or until):
+        raise ValueError("Give at least one agent, signature or date bound")
+
+    job = create_job(
+        "cleanup",
+        table=table,
+        agents=list(agents),
+        patterns=list(patterns),
+        regex=regex,
+        since=since,
+        until=until,
+        deleted=0
+    )
+    threading.Thread(
+        target=run_cleanup,
+        args=(job, table, list(agents), list(patterns), regex, since, until),
+        name=f"cleanup-{job['id'][:8]}",
+        daemon=True
+    ).start()
+    return job["id"]
+
+
+# ---------- Retention scheduler ----------
+_scheduler_pid = None
+
+
+def _run_retention_once():
+    """Apply RETENTION_DAYS if this host hasn't in the last RETENTION_INTERVAL."""
+    os.makedirs(JOB_DIR, exist_ok=True)
+    with open(os.path.join(JOB_DIR, "retention.lock"), "a+") as lock:
+        try:
+            # Only one worker on the host runs the policy
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        lock.seek(0)
+        last_run = float(lock.read().strip() or 0)
+        if time.time() - last_run < RETENTION_INTERVAL:
+            return
+
+        for table, days in RETENTION_DAYS.items():
+            if days > 0:
+                cutoff = (datetime.now(MY_TZ) - timedelta(days=days)).isoformat(timespec="seconds")
+                job = create_job("retention", table=table, until=cutoff, deleted=0)
+                run_cleanup(job, table, until=cutoff)
+
+        lock.seek(0)
+        lock.truncate()
+        lock.write(str(time.time()))
+
+
+def start_retention_scheduler():
+    """Start the daily retention thread in this process (no-op when no policy is set)."""
+    global _scheduler_pid
+    if _scheduler_pid == os.getpid() or not any(RETENTION_DAYS.values()):
+        return
+    _scheduler_pid = os.getpid()
+
+    def loop():
+        while True:
+            try:
+                _run_retention_once()
+            except Exception as e:
+                print(f"[RETENTION] failed: {e}")
+            time.sleep(60 * 60)
+
+    threading.Thread(target=loop, name="retention-scheduler", daemon=True).start()
@@ -0,0 +1,42 @@
+# admin/jobs.py
+import json
+import os
+import tempfile
+import uuid
+
+# Job records live on local disk so any gunicorn worker on this host can report them
+JOB_DIR = os.path.join(tempfile.gettempdir(), "tracklink-admin-jobs")
+
+
+def _job_path(job_id):
+    return os.path.join(JOB_DIR, f"{job_id}.json")
+
+
+def _write_job(job):
+    os.makedirs(JOB_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=JOB_DIR, suffix=".part")
+    with os.fdopen(fd, "w") as f:
+        json.dump(job, f, default=str)
+    os.replace(tmp_path, _job_path(job["id"]))
+
+
+def create_job(kind, **fields):
+    job = {"id": str(uuid.uuid4()), "kind": kind, "status": "queued", "error": None}
+    job.update(fields)
+    _write_job(job)
+    return job
+
+
+def update_job(job, **changes):
+    job.update(changes)
+    _write_job(job)
+
+
+def get_job(job_id):
+    """Status dict for a job, or None if unknown."""
+    try:
+        uuid.UUID(job_id)
+        with open(_job_path(job_id)) as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        return None
@@ -1,6 +1,25 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
+from flask import Blueprint, Response, render_template, request, redirect, url_for, session, flash
 from supabase_client import supabase
+from landing.feed_cache import mark_changed, chronicle_page
+import csv
+import io
+import json
+import os
 import uuid
+import metrics
+from image_variants import mark_for_variants, variant_name, VARIANT_WIDTHS
+from admin import visit_stats
+from admin.jobs import get_job
+from admin.cleanup_jobs import start_cleanup_job
+from admin.upload_jobs import spool_upload, start_upload_job
+from admin.table_query import (
+    fetch_table_page,
+    parse_columns,
+    order_column,
+    EXPORT_PAGE_SIZE,
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE
+)
 
 admin_bp = Blueprint(
     "admin",
@@ -11,6 +30,9 @@ admin_bp = Blueprint(
 
 ADMIN_KEY = "secret-5678"
 
+# Bearer token for Prometheus scrapes of /admin/metrics (admin session works too)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
 # ---------------- Login ----------------
 @admin_bp.route("/", methods=["GET", "POST"])
 def admin_login():
@@ -48,39 +70,55 @@ def dashboard():
         chat_tables=chat_tables,
         activity_tables=activity_tables,
         ui_tables=ui_tables,
+        slowest=metrics.slowest(10),
         name="Admin"
     )
 
+# ---------------- Metrics ----------------
+@admin_bp.route("/metrics")
+def metrics_export():
+    token_ok = METRICS_TOKEN and request.headers.get("Authorization") == f"Bearer {METRICS_TOKEN}"
+    if not token_ok and not session.get("admin_logged_in"):
+        return Response("Unauthorized", status=401)
+
+    return Response(metrics.prometheus_text(), mimetype="text/plain; version=0.0.4")
+
 # ---------------- View Table ----------------
 @admin_bp.route("/table/<db_name>/<table_name>")
 def view_table(db_name, table_name):
     if not session.get("admin_logged_in"):
         return redirect(url_for("admin.admin_login"))
 
+    sort = "asc" if request.args.get("sort") == "asc" else "desc"
+    columns = parse_columns(request.args.get("columns"))
+    limit = min(max(request.args.get("limit", DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    want_json = request.args.get("format") == "json"
+
     try:
-        query = supabase.table(table_name).select("*")
-
-        if table_name == "messages":
-            query = query.order("time", desc=True)
-        elif table_name == "user_activity":
-            query = query.order("access_time", desc=True)
-        elif table_name == "bottles":
-            query = query.order("created_at", desc=True)
-        elif table_name == "visits":
-            query = query.order("visit_time", desc=True)
-        elif table_name == "chronicle_posts":
-            query = query.order("created_at", desc=True)
+        # Keyset page on the table's order column; the UI fetches further pages as JSON on scroll
+        rows, next_cursor = fetch_table_page(
+            table_name,
+            desc=(sort == "desc"),
+            after=request.args.get("after"),
+            after_id=request.args.get("after_id"),
+            columns=columns,
+            limit=limit
+        )
+        if columns:
+            columns = [c for c in columns if not rows or c in rows[0]]
         else:
-            query = query.order("id", desc=True)
-
-        resp = query.limit(2000).execute()
-        rows = resp.data or []
-        columns = list(rows[0].keys()) if rows else []
+            columns = list(rows[0].keys()) if rows else []
 
     except Exception as e:
         print("[ADMIN TABLE ERROR]", e)
+        if want_json:
+            return {"success": False, "error": str(e)}, 500
         rows = []
         columns = []
+        next_cursor = None
+
+    if want_json:
+        return {"success": True, "rows": rows, "columns": columns, "next": next_cursor}
 
     return render_template(
         "table_view.html",
@@ -88,7 +126,83 @@ def view_table(db_name, table_name):
         table_name=table_name,
         rows=rows,
         columns=columns,
-        can_delete=(db_name == "chat")
+        can_delete=(db_name == "chat"),
+        sort=sort,
+        order_col=order_column(table_name),
+        selected_columns=request.args.get("columns", ""),
+        limit=limit,
+        next_cursor=next_cursor
+    )
+
+# ---------------- Export Table ----------------
+def _iter_table_rows(table_name, desc, columns, since, until):
+    """Every row of a table, read one keyset page at a time."""
+    cursor = {}
+    while True:
+        rows, cursor = fetch_table_page(
+            table_name, desc=desc, columns=columns, limit=EXPORT_PAGE_SIZE,
+            since=since, until=until, **(cursor or {})
+        )
+        yield from rows
+        if not cursor:
+            return
+
+
+def _export_csv(rows, columns):
+    buf = io.StringIO()
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(buf, fieldnames=columns or list(row.keys()), extrasaction="ignore")
+            writer.writeheader()
+        writer.writerow(row)
+        # Flush roughly every 64 KiB so memory stays flat
+        if buf.tell() > 65536:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def _export_ndjson(rows, columns):
+    for row in rows:
+        if columns:
+            row = {c: row.get(c) for c in columns}
+        yield json.dumps(row, ensure_ascii=False, default=str) + "\n"
+
+
+@admin_bp.route("/table/<db_name>/<table_name>/export")
+def export_table(db_name, table_name):
+    """
+    Stream a whole table as CSV (default) or NDJSON (?format=ndjson).
+    Accepts the same ?sort and ?columns as view_table, plus ?since / ?until
+    bounds on the table's order column.
+    """
+    if not session.get("admin_logged_in"):
+        return redirect(url_for("admin.admin_login"))
+
+    fmt = "ndjson" if request.args.get("format") == "ndjson" else "csv"
+    columns = parse_columns(request.args.get("columns"))
+    rows = _iter_table_rows(
+        table_name,
+        desc=(request.args.get("sort") != "asc"),
+        columns=columns,
+        since=request.args.get("since") or None,
+        until=request.args.get("until") or None
+    )
+
+    if fmt == "csv":
+        body, mimetype = _export_csv(rows, columns), "text/csv"
+    else:
+        body, mimetype = _export_ndjson(rows, columns), "application/x-ndjson"
+
+    return Response(
+        body,
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f'attachment; filename="{table_name}.{fmt}"',
+            "X-Accel-Buffering": "no"
+        }
     )
 
 # ---------------- UI Messages ----------------
@@ -128,6 +242,7 @@ def create_message():
 
             resp = supabase.table("ui_messages").insert(new_msg).execute()
             print("Supabase insert response:", resp)
+            mark_changed("ui_messages")
 
             flash("Message created successfully!", "success")
             return redirect(url_for("admin.admin_messages"))
@@ -152,6 +267,7 @@ def toggle_message(msg_id):
             new_status = not current.data['active']
             # 2. Update to opposite
             supabase.table("ui_messages").update({"active": new_status}).eq("id", msg_id).execute()
+            mark_changed("ui_messages")
             flash(f"Message {'activated' if new_status else 'deactivated'}.", "success")
     except Exception as e:
         flash(f"Error toggling status: {e}", "error")
@@ -165,6 +281,7 @@ def delete_ui_message(msg_id):
         return redirect(url_for("admin.admin_login"))
     
     supabase.table("ui_messages").delete().eq("id", msg_id).execute()
+    mark_changed("ui_messages")
     flash("Message deleted.", "info")
     return redirect(url_for("admin.admin_messages"))
 
@@ -193,6 +310,7 @@ def edit_message(msg_id):
             }
 
             supabase.table("ui_messages").update(update_data).eq("id", msg_id).execute()
+            mark_changed("ui_messages")
             flash("Message updated successfully!", "success")
             return redirect(url_for("admin.admin_messages"))
 
@@ -209,18 +327,22 @@ def landing_preview():
         return redirect(url_for("admin.admin_login"))
 
     # Import here to avoid circular import
-    from landing.routes import get_landing_messages
-
-    greeting_text, ps_text = get_landing_messages()
+    from landing.routes import get_messages_snapshot
+    from landing.page_cache import page_cache, page_response
 
-    return render_template(
+    # Its own cache slot: the public landing page never gets the unlocked variant
+    snapshot = get_messages_snapshot()
+    page = page_cache.render(
         "landing.html",
-        greeting_text=greeting_text,
-        ps_text=ps_text,
+        snapshot.etag,
+        variant="admin_preview",
+        greeting_text=snapshot.data["greeting"],
+        ps_text=snapshot.data["ps"],
         birthday_verified=True,   # force unlocked
         admin_preview=True,       # special flag
         error=None
     )
+    return page_response(page)
 
 # ---------------- Visit Cleanup Utility ----------------
 @admin_bp.route("/cleanup/visits", methods=["GET"])
@@ -229,20 +351,50 @@ def visit_cleanup_list():
         return redirect(url_for("admin.admin_login"))
 
     try:
-        # Get counts of unique user agents to see which ones are "junk"
-        resp = supabase.table("visits").select("user_agent").execute()
-        agents = {}
-        for row in (resp.data or []):
-            ua = row.get("user_agent") or "Empty / None"
-            agents[ua] = agents.get(ua, 0) + 1
-        
-        # Sort by count descending
-        sorted_agents = sorted(agents.items(), key=lambda x: x[1], reverse=True)
+        # Counts of unique user agents to see which ones are "junk" (grouped server-side, cached)
+        sorted_agents = visit_stats.user_agent_counts()
     except Exception as e:
         flash(f"Error fetching agents: {e}", "error")
         sorted_agents = []
 
-    return render_template("cleanup_visits.html", agents=sorted_agents)
+    return render_template(
+        "cleanup_visits.html",
+        agents=sorted_agents,
+        cleanup_job=request.args.get("cleanup_job")
+    )
+
+@admin_bp.route("/cleanup/bulk", methods=["POST"])
+def bulk_cleanup():
+    if not session.get("admin_logged_in"):
+        return redirect(url_for("admin.admin_login"))
+
+    def lines(field):
+        return [l.strip() for l in request.form.get(field, "").splitlines() if l.strip()]
+
+    try:
+        job_id = start_cleanup_job(
+            request.form.get("table", "visits"),
+            agents=lines("agents"),
+            patterns=lines("patterns"),
+            regex=request.form.get("pattern_mode") == "regex",
+            since=request.form.get("since") or None,
+            until=request.form.get("until") or None
+        )
+        flash("Cleanup started in the background.", "success")
+        return redirect(url_for("admin.visit_cleanup_list", cleanup_job=job_id))
+    except ValueError as e:
+        flash(f"Cleanup not started: {e}", "error")
+        return redirect(url_for("admin.visit_cleanup_list"))
+
+@admin_bp.route("/cleanup/jobs/<job_id>")
+def cleanup_job_status(job_id):
+    if not session.get("admin_logged_in"):
+        return {"success": False, "error": "not logged in"}, 401
+
+    job = get_job(job_id)
+    if not job:
+        return {"success": False, "error": "unknown job"}, 404
+    return {"success": True, **job}
 
 @admin_bp.route("/cleanup/visits/delete", methods=["POST"])
 def delete_by_agent():
@@ -252,16 +404,45 @@ def delete_by_agent():
     ua_to_delete = request.form.get("user_agent")
     
     # Handle the 'Empty' case logic
-    target_ua = "" if ua_to_delete == "Empty / None" else ua_to_delete
+    target_ua = "" if ua_to_delete == visit_stats.EMPTY_AGENT else ua_to_delete
 
     try:
         supabase.table("visits").delete().eq("user_agent", target_ua).execute()
+        visit_stats.invalidate()
         flash(f"Successfully deleted all records for agent: '{ua_to_delete}'", "success")
     except Exception as e:
         flash(f"Delete failed: {e}", "error")
 
     return redirect(url_for("admin.visit_cleanup_list"))
 
+# ---------------- Chronicle Media Helpers ----------------
+def remove_chronicle_media(media_url):
+    """Delete an uploaded chronicle object and its resized variants (no-op for Spotify URLs)."""
+    # The URL looks like: .../storage/v1/object/public/chronicle/uploads/filename.jpg
+    # We need: "uploads/filename.jpg"
+    if not media_url or "/chronicle/uploads/" not in media_url:
+        return
+    file_path = "uploads/" + media_url.split("uploads/")[1].split("?")[0]
+    try:
+        supabase.storage.from_("chronicle").remove(
+            [file_path] + [variant_name(file_path, w) for w in VARIANT_WIDTHS]
+        )
+        print(f"Deleted file from storage: {file_path}")
+    except Exception as e:
+        print(f"Failed to delete {file_path} from storage: {e}")
+
+
+@admin_bp.route("/chronicle/upload-status/<job_id>")
+def chronicle_upload_status(job_id):
+    if not session.get("admin_logged_in"):
+        return {"success": False, "error": "not logged in"}, 401
+
+    job = get_job(job_id)
+    if not job:
+        return {"success": False, "error": "unknown job"}, 404
+    return {"success": True, **job}
+
+
 @admin_bp.route("/chronicle/create", methods=["GET", "POST"])
 def create_chronicle_post():
     if not session.get("admin_logged_in"):
@@ -278,20 +459,24 @@ def create_chronicle_post():
                 file = request.files.get('file')
                 if file and file.filename != '':
                     file_extension = file.filename.rsplit('.', 1)[-1]
-                    unique_name = f"{uuid.uuid4()}.{file_extension}"
+                    unique_name = mark_for_variants(f"{uuid.uuid4()}.{file_extension}")
                     file_path = f"uploads/{unique_name}"
-                    
-                    file_content = file.read()
-                    
-                    # Upload to Supabase Storage
-                    upload_resp = supabase.storage.from_("chronicle").upload(
-                        path=file_path, 
-                        file=file_content, 
-                        file_options={"content-type": file.content_type}
-                    )
-                    
-                    # Get the Public URL
-                    media_url = supabase.storage.from_("chronicle").get_public_url(file_path)
+
+                    # Spool to disk in chunks; the storage upload and insert run in the background
+                    spool_path, size = spool_upload(file)
+
+                    def finalize(media_url):
+                        supabase.table("chronicle_posts").insert({
+                            "content": content,
+                            "media_type": media_type,
+                            "media_url": media_url,
+                            "is_active": True
+                        }).execute()
+                        mark_changed("chronicle")
+
+                    job_id = start_upload_job(spool_path, size, file_path, file.content_type, finalize)
+                    flash("Uploading media… the post will appear once it finishes.", "success")
+                    return redirect(url_for("admin.manage_chronicle", upload_job=job_id))
                 else:
                     flash("No file selected for upload!", "error")
                     return redirect(request.url)
@@ -314,6 +499,7 @@ def create_chronicle_post():
                 "media_url": media_url,
                 "is_active": True
             }).execute()
+            mark_changed("chronicle")
 
             flash("Transmission sent to Chronicle!", "success")
             return redirect(url_for("admin.manage_chronicle")) # Redirect to manage page to see it
@@ -332,19 +518,16 @@ def chronicle_preview():
     
     source = request.args.get("source")
 
-    # Reuse the logic to fetch posts
+    # Reuse the landing feed logic (latest page, lazy-loads older ones)
     try:
-        resp = supabase.table("chronicle_posts")\
-            .select("*")\
-            .eq("is_active", True)\
-            .order("created_at", desc=False).execute()
-        posts = resp.data or []
+        initial_page = chronicle_page()
     except Exception as e:
-        posts = []
+        initial_page = {"success": False, "version": None, "posts": [], "older": None}
 
     return render_template(
         "chronicle.html",
-        posts=posts,
+        posts=initial_page["posts"],
+        initial_page=initial_page,
         admin_preview=True,
         source=source
     )
@@ -356,7 +539,11 @@ def manage_chronicle():
     
     # Fetch all posts (including inactive ones)
     resp = supabase.table("chronicle_posts").select("*").order("created_at", desc=True).execute()
-    return render_template("manage_chronicle.html", posts=resp.data)
+    return render_template(
+        "manage_chronicle.html",
+        posts=resp.data,
+        upload_job=request.args.get("upload_job")
+    )
 
 @admin_bp.route("/chronicle/toggle/<post_id>", methods=["POST"])
 def toggle_chronicle(post_id):
@@ -366,6 +553,7 @@ def toggle_chronicle(post_id):
     
     # 2. Update status
     supabase.table("chronicle_posts").update({"is_active": new_status}).eq("id", post_id).execute()
+    mark_changed("chronicle")
     return redirect(url_for("admin.manage_chronicle"))
 
 @admin_bp.route("/chronicle/delete/<post_id>")
@@ -379,19 +567,12 @@ def delete_chronicle(post_id):
         post = resp.data
 
         if post and post.get("media_url") and post.get("media_type") in ['image', 'video']:
-            # 2. Extract the file path from the URL
-            # The URL looks like: .../storage/v1/object/public/chronicle/uploads/filename.jpg
-            # We need: "uploads/filename.jpg"
-            full_url = post["media_url"]
-            if "uploads/" in full_url:
-                file_path = "uploads/" + full_url.split("uploads/")[1]
-                
-                # 3. Delete from Supabase Storage
-                supabase.storage.from_("chronicle").remove([file_path])
-                print(f"Deleted file from storage: {file_path}")
+            # 2-3. Delete the object (and its variants) from Supabase Storage
+            remove_chronicle_media(post["media_url"])
 
         # 4. Delete from Database
         supabase.table("chronicle_posts").delete().eq("id", post_id).execute()
+        mark_changed("chronicle")
         flash("Post and associated media deleted successfully.", "info")
 
     except Exception as e:
@@ -432,16 +613,23 @@ def edit_chronicle(post_id):
                 file = request.files.get('file')
                 if file and file.filename != '':
                     file_extension = file.filename.rsplit('.', 1)[-1]
-                    unique_name = f"{uuid.uuid4()}.{file_extension}"
+                    unique_name = mark_for_variants(f"{uuid.uuid4()}.{file_extension}")
                     file_path = f"uploads/{unique_name}"
-                    
-                    # Upload and get URL
-                    supabase.storage.from_("chronicle").upload(
-                        path=file_path, 
-                        file=file.read(), 
-                        file_options={"content-type": file.content_type}
-                    )
-                    update_data["media_url"] = supabase.storage.from_("chronicle").get_public_url(file_path)
+
+                    # Upload in the background; the row switches to the new media when it's done
+                    spool_path, size = spool_upload(file)
+                    old_media_url = post.get("media_url")
+
+                    def finalize(media_url):
+                        supabase.table("chronicle_posts").update(
+                            dict(update_data, media_url=media_url)
+                        ).eq("id", post_id).execute()
+                        mark_changed("chronicle")
+                        remove_chronicle_media(old_media_url)
+
+                    job_id = start_upload_job(spool_path, size, file_path, file.content_type, finalize)
+                    flash("Uploading new media… the post updates once it finishes.", "success")
+                    return redirect(url_for("admin.manage_chronicle", upload_job=job_id))
 
             elif media_type == 'spotify':
                 raw_url = request.form.get("spotify_url")
@@ -451,6 +639,12 @@ def edit_chronicle(post_id):
 
             # 2. Update the database (Removed 'updated_at' to prevent the error)
             supabase.table("chronicle_posts").update(update_data).eq("id", post_id).execute()
+            mark_changed("chronicle")
+
+            # Switching away from uploaded media leaves the old object unused
+            if update_data.get("media_url") and update_data["media_url"] != post.get("media_url"):
+                remove_chronicle_media(post.get("media_url"))
+
             flash("Chronicle updated successfully!", "success")
             return redirect(url_for("admin.manage_chronicle"))
 
@@ -0,0 +1,91 @@
+# admin/table_query.py
+import re
+
+from supabase_client import supabase, quote_filter_value
+
+# Column each admin table is ordered (and keyset-paginated) by; anything else uses "id"
+TABLE_ORDER_COLUMNS = {
+    "messages": "time",
+    "user_activity": "access_time",
+    "bottles": "created_at",
+    "visits": "visit_time",
+    "chronicle_posts": "created_at",
+}
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+EXPORT_PAGE_SIZE = 1000
+
+_IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def order_column(table_name):
+    return TABLE_ORDER_COLUMNS.get(table_name, "id")
+
+
+def parse_columns(raw):
+    """'id, page,visit_time' -> ['id', 'page', 'visit_time'] (invalid names dropped); None = all."""
+    if not raw:
+        return None
+    columns = [c.strip() for c in raw.split(",")]
+    return [c for c in columns if _IDENTIFIER_RE.match(c)] or None
+
+
+def page_cursor(table_name, row):
+    """
+    Keyset cursor pointing just past `row`. A NULL order value gives an id-only
+    cursor: the page ended inside the NULL block, which Postgres sorts as the
+    largest values (last ascending, first descending).
+    """
+    col = order_column(table_name)
+    if row.get(col) is None:
+        return {"after_id": row.get("id")}
+    return {"after": row.get(col), "after_id": row.get("id")}
+
+
+def fetch_table_page(table_name, desc=True, after=None, after_id=None, columns=None,
+                     limit=DEFAULT_PAGE_SIZE, since=None, until=None):
+    """
+    One keyset page of `table_name` ordered by its order column (ties broken by id).
+    - `after` / `after_id`: cursor from page_cursor() of the previous page's last row
+    - `columns`: projection; the order column and id are always included for the cursor
+    - `since` / `until`: optional range filter on the order column
+    Returns (rows, next_cursor or None).
+    """
+    col = order_column(table_name)
+
+    if columns:
+        select = list(dict.fromkeys(columns + [col, "id"]))
+        query = supabase.table(table_name).select(",".join(select))
+    else:
+        query = supabase.table(table_name).select("*")
+
+    if since:
+        query = query.gte(col, since)
+    if until:
+        query = query.lt(col, until)
+
+    op = "lt" if desc else "gt"
+    if after is not None:
+        if col == "id":
+            query = getattr(query, op)("id", after)
+        else:
+            # Ascending, the NULL block still lies ahead of any non-NULL cursor
+            nulls = "" if desc else f",{col}.is.null"
+            query = query.or_(
+                f"{col}.{op}.{quote_filter_value(after)},and({col}.eq.{quote_filter_value(after)},id.{op}.{quote_filter_value(after_id)}){nulls}"
+            )
+    elif after_id is not None and col != "id":
+        # Id-only cursor: rest of the NULL block, then (descending) every non-NULL row
+        if desc:
+            query = query.or_(f"and({col}.is.null,id.lt.{quote_filter_value(after_id)}),{col}.not.is.null")
+        else:
+            query = query.is_(col, "null").gt("id", after_id)
+
+    query = query.order(col, desc=desc)
+    if col != "id":
+        query = query.order("id", desc=desc)
+
+    rows = query.limit(limit).execute().data or []
+    next_cursor = page_cursor(table_name, rows[-1]) if len(rows) == limit else None
+    return rows, next_cursor
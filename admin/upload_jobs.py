@@ -0,0 +1,139 @@
+# admin/upload_jobs.py
+import base64
+import os
+import shutil
+import tempfile
+import threading
+
+import httpx
+
+import supabase_client
+from supabase_client import supabase
+from image_variants import is_image, queue_storage_variants
+from admin.jobs import JOB_DIR, create_job, update_job
+
+SPOOL_CHUNK_SIZE = 256 * 1024
+TUS_CHUNK_SIZE = 6 * 1024 * 1024  # Supabase's resumable endpoint expects 6 MiB chunks
+TUS_MAX_RESUMES = 3
+# Largest chronicle media accepted; app.config["MAX_CONTENT_LENGTH"] is derived from it
+CHRONICLE_MAX_UPLOAD_SIZE = int(os.getenv("CHRONICLE_MAX_UPLOAD_SIZE", str(500 * 1024 * 1024)))
+
+
+# ---------- Request side ----------
+def spool_upload(file):
+    """Copy the request's file stream to a temp file in chunks. Returns (path, size)."""
+    os.makedirs(JOB_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=JOB_DIR, prefix="spool-")
+    with os.fdopen(fd, "wb") as out:
+        shutil.copyfileobj(file.stream, out, SPOOL_CHUNK_SIZE)
+        size = out.tell()
+    return tmp_path, size
+
+
+def start_upload_job(spool_path, size, storage_path, content_type, finalize, bucket="chronicle"):
+    """
+    Upload a spooled file to Supabase Storage on a background thread.
+    `finalize(media_url)` runs after the upload succeeds (e.g. insert/update the post).
+    Returns the job id for the status endpoint.
+    """
+    job = create_job("upload", storage_path=storage_path, total=size, uploaded=0, media_url=None)
+
+    # Not a daemon: a graceful worker shutdown waits for in-flight uploads
+    threading.Thread(
+        target=_run_job,
+        args=(job, spool_path, storage_path, content_type, finalize, bucket),
+        name=f"upload-{job['id'][:8]}"
+    ).start()
+    return job["id"]
+
+
+# ---------- Background side ----------
+def _tus_headers(extra=None):
+    _, key = supabase_client.credentials()
+    headers = {
+        "Authorization": f"Bearer {key}",
+        "apikey": key,
+        "Tus-Resumable": "1.0.0",
+    }
+    headers.update(extra or {})
+    return headers
+
+
+def _b64(value):
+    return base64.b64encode(value.encode("utf-8")).decode("ascii")
+
+
+def _tus_upload(spool_path, size, storage_path, content_type, bucket, progress):
+    """Resumable (TUS) upload in 6 MiB chunks, resuming from the server's offset on errors."""
+    url, _ = supabase_client.credentials()
+    endpoint = f"{url}/storage/v1/upload/resumable"
+    metadata = ",".join([
+        f"bucketName {_b64(bucket)}",
+        f"objectName {_b64(storage_path)}",
+        f"contentType {_b64(content_type or 'application/octet-stream')}",
+    ])
+
+    with httpx.Client(timeout=httpx.Timeout(60, connect=10)) as http:
+        resp = http.post(endpoint, headers=_tus_headers({
+            "Upload-Length": str(size),
+            "Upload-Metadata": metadata,
+        }))
+        resp.raise_for_status()
+        location = resp.headers["Location"]
+
+        offset, resumes = 0, 0
+        with open(spool_path, "rb") as f:
+            while offset < size:
+                f.seek(offset)
+                chunk = f.read(TUS_CHUNK_SIZE)
+                try:
+                    resp = http.patch(location, content=chunk, headers=_tus_headers({
+                        "Upload-Offset": str(offset),
+                        "Content-Type": "application/offset+octet-stream",
+                    }))
+                    resp.raise_for_status()
+                    offset = int(resp.headers.get("Upload-Offset", offset + len(chunk)))
+                except httpx.HTTPError:
+                    if resumes >= TUS_MAX_RESUMES:
+                        raise
+                    resumes += 1
+                    # Ask the server how far it got and continue from there
+                    head = http.head(location, headers=_tus_headers())
+                    head.raise_for_status()
+                    offset = int(head.headers["Upload-Offset"])
+                progress(offset)
+
+
+def _run_job(job, spool_path, storage_path, content_type, finalize, bucket):
+    update_job(job, status="uploading")
+    try:
+        try:
+            _tus_upload(
+                spool_path, job["total"], storage_path, content_type, bucket,
+                progress=lambda n: update_job(job, uploaded=n)
+            )
+        except httpx.HTTPStatusError as e:
+            # Resumable endpoint unavailable: plain upload, still streamed from disk
+            print(f"[UPLOAD JOB] resumable upload failed ({e}), falling back")
+            supabase.storage.from_(bucket).upload(
+                path=storage_path,
+                file=spool_path,
+                file_options={"content-type": content_type}
+            )
+            update_job(job, uploaded=job["total"])
+
+        media_url = supabase.storage.from_(bucket).get_public_url(storage_path)
+        if is_image(storage_path):
+            with open(spool_path, "rb") as f:
+                queue_storage_variants(f.read(), storage_path, supabase.storage.from_(bucket))
+
+        finalize(media_url)
+        update_job(job, status="done", media_url=media_url)
+    except Exception as e:
+        print(f"[UPLOAD JOB] {job['id']} failed: {e}")
+        update_job(job, status="failed", error=str(e))
+    finally:
+        try:
+            os.remove(spool_path)
+        except OSError:
+            pass
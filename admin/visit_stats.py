@@ -0,0 +1,72 @@
+# admin/visit_stats.py
+"""
+User-agent histogram for the visit cleanup page.
+
+Counts come from a Postgres function so only one row per distinct agent
+crosses the wire. Create it once in the Supabase SQL editor:
+
+    create or replace function visit_user_agent_counts()
+    returns table (user_agent text, visits bigint)
+    language sql stable as $$
+        select user_agent, count(*) from visits
+        group by user_agent order by count(*) desc
+    $$;
+
+Until it exists, the histogram falls back to paging through the
+user_agent column and counting in Python.
+"""
+from supabase_client import supabase
+from ttl_cache import TTLCache
+
+EMPTY_AGENT = "Empty / None"
+AGENT_COUNTS_TTL = 300
+SCAN_PAGE_SIZE = 1000
+
+_cache = TTLCache(ttl=AGENT_COUNTS_TTL, max_size=1)
+
+
+def _counts_from_rpc():
+    rows = supabase.rpc("visit_user_agent_counts").execute().data or []
+    agents = {}
+    for row in rows:
+        ua = row.get("user_agent") or EMPTY_AGENT
+        agents[ua] = agents.get(ua, 0) + int(row.get("visits") or 0)
+    return agents
+
+
+def _counts_from_scan():
+    # Keyset pages on id so PostgREST's max-rows cap can't truncate the count
+    agents, last_id = {}, None
+    while True:
+        query = supabase.table("visits").select("id, user_agent").order("id").limit(SCAN_PAGE_SIZE)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.execute().data or []
+        for row in rows:
+            ua = row.get("user_agent") or EMPTY_AGENT
+            agents[ua] = agents.get(ua, 0) + 1
+        if len(rows) < SCAN_PAGE_SIZE:
+            return agents
+        last_id = rows[-1]["id"]
+
+
+def user_agent_counts():
+    """[(user_agent, visits)] sorted by count descending, cached for AGENT_COUNTS_TTL."""
+    cached = _cache.get("agents")
+    if cached is not None:
+        return cached
+
+    try:
+        agents = _counts_from_rpc()
+    except Exception as e:
+        print(f"[VISIT STATS] rpc unavailable ({e}), scanning visits")
+        agents = _counts_from_scan()
+
+    # Sort by count descending
+    sorted_agents = sorted(agents.items(), key=lambda x: x[1], reverse=True)
+    _cache.set("agents", sorted_agents)
+    return sorted_agents
+
+
+def invalidate():
+    _cache.clear()
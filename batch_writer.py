@@ -0,0 +1,133 @@
+# batch_writer.py
+import atexit
+import os
+import queue
+import threading
+import time
+
+from supabase_client import supabase
+
+
+class BatchWriter:
+    """
+    Buffer rows in memory and insert them into a Supabase table in bulk.
+    - Request threads only enqueue (never wait on the network)
+    - A background thread flushes when `batch_size` rows are waiting
+      or `flush_interval` seconds have passed, whichever comes first
+    - When the buffer is full new rows are dropped and counted
+    """
+
+    def __init__(self, table, batch_size=50, flush_interval=2.0, max_size=5000):
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+
+        self.stats = {"enqueued": 0, "dropped": 0, "flushed": 0, "failed": 0, "batches": 0}
+
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._stop = None
+        self._pid = None
+
+    # ---------- Worker lifecycle ----------
+    def _ensure_worker(self):
+        # Started lazily (and restarted after fork) so each gunicorn worker owns its thread
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._queue = queue.Queue(maxsize=self.max_size)
+            self._stop = threading.Event()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name=f"batch-writer-{self.table}", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch:
+                self._insert(batch)
+        # Drain whatever is left once stop() was requested
+        self.flush()
+
+    def _collect(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _count(self, key, n=1):
+        # submit() runs on every request thread while the flush thread updates too
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _insert(self, batch):
+        try:
+            supabase.table(self.table).insert(batch).execute()
+            self._count("flushed", len(batch))
+            self._count("batches")
+        except Exception as e:
+            self._count("failed", len(batch))
+            print(f"Failed to flush {len(batch)} rows into {self.table}: {e}")
+
+    # ---------- Public API ----------
+    def submit(self, row):
+        """Queue a row for insertion. Returns False if it had to be dropped."""
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("enqueued")
+        return True
+
+    def flush(self):
+        """Synchronously insert everything currently buffered."""
+        if self._queue is None or self._pid != os.getpid():
+            return
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._insert(batch)
+
+    def stop(self, timeout=5.0):
+        """Stop the worker thread, flushing pending rows first."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self.flush()
+
+    def pending(self):
+        return self._queue.qsize() if self._queue is not None and self._pid == os.getpid() else 0
+
+
+# ---------- Shared writers ----------
+visit_writer = BatchWriter("visits")
+activity_writer = BatchWriter("user_activity")
+
+
+@atexit.register
+def _flush_on_exit():
+    for writer in (visit_writer, activity_writer):
+        writer.stop()
@@ -0,0 +1,435 @@
+# bench/fake_supabase.py
+"""
+In-memory stand-in for the slice of supabase-py that TrackLink uses, for
+benchmarks only. Every execute() / storage call sleeps for the configured
+latency so caching and round-trip changes show up in the numbers.
+
+Supported: table().select(cols, count=, head=) / insert / upsert / update /
+delete, filters eq / neq / gt / gte / lt / lte / in_ / is_ / not_ / or_,
+order / limit / range / single, rpc() for the functions registered in
+RPCS, and storage from_().upload / remove / get_public_url.
+"""
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import date, datetime
+
+
+class FakeAPIError(Exception):
+    pass
+
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+def _json_value(value):
+    # What the real client would send over the wire
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _coerce(stored, value):
+    """Bring a filter value (often a string from or_()) to the stored value's type."""
+    if isinstance(value, str) and stored is not None and not isinstance(stored, str):
+        if isinstance(stored, bool):
+            return value.lower() == "true"
+        try:
+            return type(stored)(value)
+        except (TypeError, ValueError):
+            return value
+    return _json_value(value)
+
+
+def _compare(op, stored, value):
+    if op == "is":
+        return stored is None if str(value).lower() == "null" else stored == _coerce(stored, value)
+    if op == "in":
+        return stored in {_coerce(stored, v) for v in value}
+    if stored is None:
+        return op == "neq"
+    value = _coerce(stored, value)
+    if op == "eq":
+        return stored == value
+    if op == "neq":
+        return stored != value
+    try:
+        if op == "gt":
+            return stored > value
+        if op == "gte":
+            return stored >= value
+        if op == "lt":
+            return stored < value
+        if op == "lte":
+            return stored <= value
+    except TypeError:
+        return False
+    if op in ("like", "ilike"):
+        pattern = str(value).replace("*", "%")
+        text, pattern = (str(stored).lower(), pattern.lower()) if op == "ilike" else (str(stored), pattern)
+        parts = pattern.split("%")
+        return text.startswith(parts[0]) and text.endswith(parts[-1]) and all(p in text for p in parts)
+    if op in ("match", "imatch"):
+        return re.search(str(value), str(stored), re.IGNORECASE if op == "imatch" else 0) is not None
+    raise FakeAPIError(f"unsupported operator {op}")
+
+
+# ---------- or_() expressions ----------
+def _split_top(expr):
+    """Split on commas outside parentheses and double quotes."""
+    parts, depth, quoted, current, escaped = [], 0, False, [], False
+    for ch in expr:
+        if escaped:
+            current.append(ch)
+            escaped = False
+            continue
+        if ch == "\\" and quoted:
+            current.append(ch)
+            escaped = True
+            continue
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and ch == ",":
+            parts.append("".join(current))
+            current = []
+            continue
+        current.append(ch)
+    parts.append("".join(current))
+    return [p for p in parts if p]
+
+
+def _unquote(value):
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+    return value
+
+
+def _parse_condition(expr):
+    """PostgREST logic tree -> predicate(row)."""
+    for group in ("and", "or"):
+        if expr.startswith(group + "(") and expr.endswith(")"):
+            children = [_parse_condition(p) for p in _split_top(expr[len(group) + 1:-1])]
+            combine = all if group == "and" else any
+            return lambda row: combine(c(row) for c in children)
+
+    column, op, value = expr.split(".", 2)
+    negate = op == "not"
+    if negate:
+        op, value = value.split(".", 1)
+    if op == "in":
+        values = [_unquote(v) for v in _split_top(value.strip("()"))]
+        predicate = lambda row: _compare("in", row.get(column), values)
+    else:
+        value = _unquote(value)
+        predicate = lambda row: _compare(op, row.get(column), value)
+    return (lambda row: not predicate(row)) if negate else predicate
+
+
+# ---------- Query builder ----------
+# (table, embedded table) -> foreign key column, for `rel!inner(...)` filters
+FOREIGN_KEYS = {
+    ("bottle_views", "bottles"): "bottle_id",
+}
+
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self._db = db
+        self._table = table
+        self._action = "select"
+        self._columns = "*"
+        self._payload = None
+        self._count = None
+        self._head = False
+        self._filters = []
+        self._order = []
+        self._limit = None
+        self._offset = 0
+        self._single = False
+        self._negate_next = False
+
+    # actions
+    def select(self, columns="*", count=None, head=False):
+        self._columns, self._count, self._head = columns, count, head
+        return self
+
+    def insert(self, rows):
+        self._action, self._payload = "insert", rows
+        return self
+
+    def upsert(self, rows, **kwargs):
+        self._action, self._payload = "upsert", rows
+        return self
+
+    def update(self, values):
+        self._action, self._payload = "update", values
+        return self
+
+    def delete(self):
+        self._action = "delete"
+        return self
+
+    # filters
+    def _get(self, row, column):
+        """Column value, following `rel.column` through FOREIGN_KEYS for embedded filters."""
+        if "." not in column:
+            return row.get(column)
+        rel, column = column.split(".", 1)
+        fk = FOREIGN_KEYS[(self._table, rel)]
+        related = self._db.find(rel, row.get(fk))
+        return related.get(column) if related else None
+
+    def _filter(self, predicate):
+        if self._negate_next:
+            self._negate_next = False
+            self._filters.append(lambda row: not predicate(row))
+        else:
+            self._filters.append(predicate)
+        return self
+
+    @property
+    def not_(self):
+        self._negate_next = True
+        return self
+
+    def eq(self, column, value):
+        return self._filter(lambda row: _compare("eq", self._get(row, column), value))
+
+    def neq(self, column, value):
+        return self._filter(lambda row: _compare("neq", self._get(row, column), value))
+
+    def gt(self, column, value):
+        return self._filter(lambda row: _compare("gt", self._get(row, column), value))
+
+    def gte(self, column, value):
+        return self._filter(lambda row: _compare("gte", self._get(row, column), value))
+
+    def lt(self, column, value):
+        return self._filter(lambda row: _compare("lt", self._get(row, column), value))
+
+    def lte(self, column, value):
+        return self._filter(lambda row: _compare("lte", self._get(row, column), value))
+
+    def in_(self, column, values):
+        values = list(values)
+        return self._filter(lambda row: _compare("in", self._get(row, column), values))
+
+    def is_(self, column, value):
+        return self._filter(lambda row: _compare("is", self._get(row, column), value))
+
+    def or_(self, expr):
+        children = [_parse_condition(p) for p in _split_top(expr)]
+        return self._filter(lambda row: any(c(row) for c in children))
+
+    # modifiers
+    def order(self, column, desc=False, **kwargs):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def range(self, start, end):
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    def _project(self, row):
+        if self._columns.strip() == "*":
+            return dict(row)
+        return {c.strip(): row.get(c.strip()) for c in self._columns.split(",")}
+
+    def _matches(self, row):
+        return all(f(row) for f in self._filters)
+
+    def execute(self):
+        self._db.wait(self._table, self._action)
+        with self._db.lock:
+            rows = self._db.tables.setdefault(self._table, [])
+            if self._action == "insert":
+                data = self._db.insert_rows(self._table, self._payload, upsert=False)
+            elif self._action == "upsert":
+                data = self._db.insert_rows(self._table, self._payload, upsert=True)
+            elif self._action == "update":
+                values = {k: _json_value(v) for k, v in self._payload.items()}
+                data = []
+                for row in rows:
+                    if self._matches(row):
+                        row.update(values)
+                        data.append(dict(row))
+            elif self._action == "delete":
+                data = [dict(r) for r in rows if self._matches(r)]
+                self._db.tables[self._table] = [r for r in rows if not self._matches(r)]
+            else:
+                matched = [r for r in rows if self._matches(r)]
+                count = len(matched) if self._count else None
+                # Stable sorts applied last-key-first give multi-column ordering
+                for column, desc in reversed(self._order):
+                    matched.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+                end = None if self._limit is None else self._offset + self._limit
+                data = [] if self._head else [self._project(r) for r in matched[self._offset:end]]
+                if self._single:
+                    if len(data) != 1:
+                        raise FakeAPIError(f"single() matched {len(data)} rows in {self._table}")
+                    data = data[0]
+                return FakeResponse(data, count)
+        return FakeResponse(data)
+
+
+# ---------- Storage ----------
+class FakeBucket:
+    def __init__(self, db, name):
+        self._db = db
+        self._name = name
+
+    def upload(self, path, file, file_options=None):
+        self._db.wait(f"storage:{self._name}", "upload")
+        if isinstance(file, str):
+            with open(file, "rb") as f:
+                file = f.read()
+        with self._db.lock:
+            self._db.objects[(self._name, path)] = bytes(file)
+        return {"Key": f"{self._name}/{path}"}
+
+    def remove(self, paths):
+        self._db.wait(f"storage:{self._name}", "remove")
+        with self._db.lock:
+            return [p for p in paths if self._db.objects.pop((self._name, p), None) is not None]
+
+    def get_public_url(self, path):
+        # Computed locally by the real client too; no latency
+        return f"{self._db.url}/storage/v1/object/public/{self._name}/{path}"
+
+
+class FakeStorage:
+    def __init__(self, db):
+        self._db = db
+
+    def from_(self, bucket):
+        return FakeBucket(self._db, bucket)
+
+
+# ---------- RPCs ----------
+def _rpc_visit_user_agent_counts(db, params):
+    counts = {}
+    for row in db.tables.get("visits", []):
+        counts[row.get("user_agent")] = counts.get(row.get("user_agent"), 0) + 1
+    return [{"user_agent": ua, "visits": n} for ua, n in sorted(counts.items(), key=lambda x: -x[1])]
+
+
+def _rpc_claim_daily_bottle(db, params):
+    birthday, view_date = params["p_birthday"], params["p_view_date"]
+    views = db.tables.setdefault("bottle_views", [])
+    bottles = db.tables.get("bottles", [])
+
+    today = next((v for v in views if v["birthday"] == birthday and v["view_date"] == view_date), None)
+    claimed = today is None
+    if claimed:
+        seen = {v["bottle_id"] for v in views if v["birthday"] == birthday}
+        unseen = sorted(
+            (b for b in bottles if b["birthday"] != birthday and b["id"] not in seen),
+            key=lambda b: b["created_at"]
+        )
+        if not unseen:
+            return []
+        bottle_id = unseen[0]["id"]
+        views.append({"id": uuid.uuid4().hex, "birthday": birthday, "bottle_id": bottle_id, "view_date": view_date})
+    else:
+        bottle_id = today["bottle_id"]
+    bottle = next(b for b in bottles if b["id"] == bottle_id)
+    return [{"bottle": dict(bottle), "claimed": claimed}]
+
+
+RPCS = {
+    "visit_user_agent_counts": _rpc_visit_user_agent_counts,
+    "claim_daily_bottle": _rpc_claim_daily_bottle,
+}
+
+
+class FakeRpc:
+    def __init__(self, db, fn, params):
+        self._db = db
+        self._fn = fn
+        self._params = params or {}
+
+    def execute(self):
+        self._db.wait(f"rpc:{self._fn}", "rpc")
+        if self._fn not in RPCS:
+            raise FakeAPIError(f"function {self._fn} does not exist")
+        with self._db.lock:
+            return FakeResponse(RPCS[self._fn](self._db, self._params))
+
+
+# ---------- Client ----------
+class FakeSupabase:
+    """
+    Drop-in for the supabase Client. `latency` (seconds) is slept on every
+    round trip, plus up to `jitter` extra; `calls` counts (table, op) pairs.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, url="http://fake.supabase.local"):
+        self.latency = latency
+        self.jitter = jitter
+        self.url = url
+        self.lock = threading.RLock()
+        self.tables = {}
+        self.objects = {}
+        self.calls = {}
+        self.storage = FakeStorage(self)
+
+    def wait(self, table, op):
+        with self.lock:
+            self.calls[(table, op)] = self.calls.get((table, op), 0) + 1
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def find(self, table, row_id):
+        return next((r for r in self.tables.get(table, []) if r.get("id") == row_id), None)
+
+    def total_calls(self):
+        with self.lock:
+            return sum(self.calls.values())
+
+    def insert_rows(self, table, payload, upsert):
+        rows = self.tables.setdefault(table, [])
+        new_rows = [
+            {k: _json_value(v) for k, v in r.items()}
+            for r in (payload if isinstance(payload, list) else [payload])
+        ]
+        for r in new_rows:
+            # Stand-in for serial / default primary keys
+            r.setdefault("id", uuid.uuid4().hex)
+        if upsert:
+            by_id = {r.get("id"): r for r in rows}
+            for r in new_rows:
+                if r.get("id") in by_id:
+                    by_id[r["id"]].update(r)
+                else:
+                    rows.append(r)
+        else:
+            rows.extend(new_rows)
+        return [dict(r) for r in new_rows]
+
+    def seed(self, table, rows):
+        with self.lock:
+            self.insert_rows(table, rows, upsert=False)
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, fn, params=None, *args, **kwargs):
+        return FakeRpc(self, fn, params)
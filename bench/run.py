@@ -0,0 +1,320 @@
+# bench/run.py
+"""
+Offline benchmark: drives the app through the Flask test client against
+the in-memory fake Supabase and reports throughput and p50/p99 per flow.
+
+    python -m bench.run --latency-ms 30 --save bench/baseline.json
+    python -m bench.run --latency-ms 30 --compare bench/baseline.json
+
+Needs the app's own requirements (flask, httpx, python-dotenv, ...);
+supabase-py itself is never imported because the fake is installed first.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from bench.fake_supabase import FakeSupabase
+
+MY_TZ = ZoneInfo("Asia/Kuala_Lumpur")
+BROWSER_UA = (
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 "
+    "(KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1"
+)
+BIRTHDAYS = ["030605", "ry5678"]
+
+
+# ---------- Seed data ----------
+def seed(db, scale):
+    """Populate every table the flows touch; `scale` multiplies the row counts."""
+    now = datetime.now(MY_TZ)
+
+    def ts(minutes_ago):
+        return (now - timedelta(minutes=minutes_ago)).isoformat()
+
+    db.seed("users", [
+        {"id": i, "birthday": b, "display_name": "ry" if b == "ry5678" else "user"}
+        for i, b in enumerate(BIRTHDAYS)
+    ])
+    db.seed("ui_messages", [
+        {"id": 1, "message_type": "greeting", "content": "good morning", "start_time": "00:00", "end_time": "12:00", "active": True},
+        {"id": 2, "message_type": "greeting", "content": "good evening", "start_time": "12:00", "end_time": "23:59", "active": True},
+        {"id": 3, "message_type": "ps", "content": "p.s. drink water", "start_time": "00:00", "end_time": "23:59", "active": True},
+    ])
+    db.seed("chronicle_posts", [
+        {
+            "id": i,
+            "content": f"chronicle entry {i}",
+            "media_type": None,
+            "media_url": None,
+            "is_active": i % 10 != 0,
+            "created_at": ts(60 * (100 * scale - i)),
+        }
+        for i in range(100 * scale)
+    ])
+    db.seed("messages", [
+        {
+            "id": f"m{i:07d}",
+            "time": ts(5000 * scale - i),
+            "birthday": BIRTHDAYS[i % 2],
+            "text": f"message {i}",
+            "file_path": None,
+            "active": True,
+        }
+        for i in range(500 * scale)
+    ])
+    db.seed("bottles", [
+        {
+            "id": f"b{i:07d}",
+            "birthday": BIRTHDAYS[i % 2],
+            "text": f"bottle {i}",
+            "file_path": None,
+            "created_at": ts(5000 * scale - i),
+        }
+        for i in range(200 * scale)
+    ])
+    db.seed("user_activity", [
+        {"id": f"a{i:07d}", "birthday": BIRTHDAYS[i % 2], "page": "message", "access_time": ts(i)}
+        for i in range(1000 * scale)
+    ])
+    db.seed("visits", [
+        {
+            "id": f"v{i:07d}",
+            "ip": f"10.1.{i // 256 % 256}.{i % 256}",
+            "user_agent": BROWSER_UA if i % 7 else "facebookexternalhit/1.1",
+            "page": "landing",
+            "visit_time": ts(i),
+        }
+        for i in range(2000 * scale)
+    ])
+
+
+# ---------- Flows ----------
+def _chat_login(client, birthday="030605"):
+    try:
+        client.set_cookie("birthday", birthday)
+    except TypeError:
+        # Werkzeug < 2.3: set_cookie(server_name, key, value)
+        client.set_cookie("localhost", "birthday", birthday)
+
+
+def _chronicle_version(client):
+    etag = client.get("/api/chronicle-updates").headers.get("ETag", "")
+    return etag.strip('"')
+
+
+def _admin_login(client):
+    from admin.routes import ADMIN_KEY
+    client.post("/admin/", data={"secret_key": ADMIN_KEY})
+
+
+# name -> (setup(client) -> state, request(client, state) -> response)
+FLOWS = {
+    "landing": (
+        None,
+        lambda c, s: c.get("/"),
+    ),
+    "current_messages": (
+        None,
+        lambda c, s: c.get("/current_messages"),
+    ),
+    "chronicle_page": (
+        None,
+        lambda c, s: c.get("/chronicle"),
+    ),
+    "chronicle_poll": (
+        _chronicle_version,
+        lambda c, version: c.get(f"/api/chronicle-updates?since={version}", headers={"If-None-Match": f'"{version}"'}),
+    ),
+    "chat_message": (
+        _chat_login,
+        lambda c, s: c.get("/chat/message"),
+    ),
+    "chat_bottle": (
+        _chat_login,
+        lambda c, s: c.get("/chat/bottle"),
+    ),
+    "chat_dashboard": (
+        _chat_login,
+        lambda c, s: c.get("/chat/dashboard"),
+    ),
+    "admin_table": (
+        _admin_login,
+        lambda c, s: c.get("/admin/table/chat/messages"),
+    ),
+    "admin_table_json": (
+        _admin_login,
+        lambda c, s: c.get("/admin/table/activity/visits?format=json&limit=200"),
+    ),
+}
+
+
+# ---------- Measurement ----------
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank
+    index = min(len(sorted_values), max(1, math.ceil(q * len(sorted_values)))) - 1
+    return sorted_values[index]
+
+
+def run_flow(app, db, name, requests, concurrency, warmup):
+    setup, call = FLOWS[name]
+    ips = itertools.count()
+    ips_lock = threading.Lock()
+    latencies, errors = [], []
+    lock = threading.Lock()
+    per_worker = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+
+    def next_ip():
+        # Distinct client IPs so the visit rate heuristic sees normal traffic
+        with ips_lock:
+            n = next(ips)
+        return f"10.9.{n // 256 % 256}.{n % 256}"
+
+    def worker(count):
+        client = app.test_client()
+        client.environ_base.update({"HTTP_USER_AGENT": BROWSER_UA, "HTTP_ACCEPT_ENCODING": "gzip, deflate, br"})
+        state = setup(client) if setup else None
+        for _ in range(warmup):
+            client.environ_base["HTTP_X_FORWARDED_FOR"] = next_ip()
+            call(client, state)
+        ready.wait()
+
+        mine, failed = [], 0
+        for _ in range(count):
+            client.environ_base["HTTP_X_FORWARDED_FOR"] = next_ip()
+            started = time.perf_counter()
+            try:
+                resp = call(client, state)
+                ok = resp.status_code < 400
+            except Exception as e:
+                print(f"[BENCH] {name}: {e}")
+                ok = False
+            mine.append(time.perf_counter() - started)
+            failed += 0 if ok else 1
+        with lock:
+            latencies.extend(mine)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in per_worker if n]
+    # Setup and warmup happen before the clock starts
+    ready = threading.Barrier(len(threads) + 1)
+    for t in threads:
+        t.start()
+    ready.wait()
+    calls_before = db.total_calls()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    calls = db.total_calls() - calls_before
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        "db_calls_per_req": calls / len(latencies) if latencies else 0.0,
+    }
+
+
+def _delta(new, old):
+    if not old:
+        return ""
+    return f"{(new - old) / old * 100:+.0f}%"
+
+
+def report(results, baseline=None):
+    header = f"{'flow':<18}{'req':>6}{'err':>5}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'db/req':>8}"
+    if baseline:
+        header += f"{'Δ req/s':>10}{'Δ p50':>8}{'Δ p99':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        line = (
+            f"{name:<18}{r['requests']:>6}{r['errors']:>5}{r['rps']:>10.1f}"
+            f"{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['db_calls_per_req']:>8.2f}"
+        )
+        base = (baseline or {}).get(name)
+        if base:
+            line += (
+                f"{_delta(r['rps'], base['rps']):>10}"
+                f"{_delta(r['p50_ms'], base['p50_ms']):>8}"
+                f"{_delta(r['p99_ms'], base['p99_ms']):>8}"
+            )
+        print(line)
+
+
+# ---------- Entry point ----------
+def build_app(db):
+    # Offline defaults; anything already set in the environment wins
+    os.environ.setdefault("SUPABASE_URL", db.url)
+    os.environ.setdefault("SUPABASE_KEY", "bench")
+    os.environ.setdefault("APP_WARMUP", "0")
+
+    import supabase_client
+    supabase_client.install_client(db)
+
+    from main import create_app
+    app = create_app({"TESTING": True}, warmup=False)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark TrackLink against an in-memory Supabase")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="injected round-trip latency")
+    parser.add_argument("--jitter-ms", type=float, default=5.0, help="extra random latency, 0..jitter")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per flow")
+    parser.add_argument("--concurrency", type=int, default=4, help="client threads per flow")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests per thread")
+    parser.add_argument("--scale", type=int, default=1, help="seed data multiplier")
+    parser.add_argument("--flows", default=",".join(FLOWS), help="comma-separated subset of: " + ", ".join(FLOWS))
+    parser.add_argument("--save", help="write results as JSON (e.g. a baseline)")
+    parser.add_argument("--compare", help="baseline JSON to diff against")
+    args = parser.parse_args(argv)
+
+    flows = [f for f in args.flows.split(",") if f]
+    unknown = [f for f in flows if f not in FLOWS]
+    if unknown:
+        parser.error(f"unknown flows: {', '.join(unknown)}")
+
+    db = FakeSupabase(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000)
+    seed(db, args.scale)
+    app = build_app(db)
+
+    results = {
+        name: run_flow(app, db, name, args.requests, args.concurrency, args.warmup)
+        for name in flows
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    print(
+        f"latency {args.latency_ms:g}±{args.jitter_ms:g} ms, "
+        f"{args.requests} requests x {args.concurrency} threads per flow, scale {args.scale}"
+    )
+    report(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"saved {args.save}")
+
+    return 1 if any(r["errors"] for r in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
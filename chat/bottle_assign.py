@@ -0,0 +1,133 @@
+# chat/bottle_assign.py
+"""
+Daily bottle assignment.
+
+Each user gets one bottle per day, picked from the bottles they haven't
+seen yet. The claim runs as a single Postgres function so lookup, pick
+and insert are one round trip and concurrent requests can't both claim.
+Create it once in the Supabase SQL editor:
+
+    create unique index if not exists bottle_views_birthday_view_date
+        on bottle_views (birthday, view_date);
+
+    create or replace function claim_daily_bottle(p_birthday text, p_view_date date)
+    returns table (bottle jsonb, claimed boolean)
+    language plpgsql as $$
+    declare
+        v_bottle_id bottles.id%type;
+    begin
+        -- Serialise claims for the same user and day
+        perform pg_advisory_xact_lock(hashtext(p_birthday || ':' || p_view_date));
+
+        select v.bottle_id into v_bottle_id from bottle_views v
+        where v.birthday = p_birthday and v.view_date = p_view_date;
+        claimed := v_bottle_id is null;
+
+        if claimed then
+            select b.id into v_bottle_id from bottles b
+            where b.birthday <> p_birthday
+              and not exists (
+                  select 1 from bottle_views v
+                  where v.birthday = p_birthday and v.bottle_id = b.id
+              )
+            order by b.created_at
+            limit 1;
+            if v_bottle_id is null then
+                return;
+            end if;
+            insert into bottle_views (id, birthday, bottle_id, view_date)
+            values (replace(gen_random_uuid()::text, '-', ''), p_birthday, v_bottle_id, p_view_date);
+        end if;
+
+        select to_jsonb(b) into bottle from bottles b where b.id = v_bottle_id;
+        return next;
+    end $$;
+
+Until it exists, claims fall back to the equivalent client-side queries,
+relying on the unique index to settle races.
+"""
+import uuid
+
+from supabase_client import supabase
+from ttl_cache import TTLCache
+
+# (birthday, view_date) -> bottle row; a claim never changes within the day
+_claims = TTLCache(ttl=24 * 60 * 60, max_size=4096)
+
+
+def _claim_with_rpc(birthday, view_date):
+    rows = supabase.rpc(
+        "claim_daily_bottle",
+        {"p_birthday": birthday, "p_view_date": view_date}
+    ).execute().data or []
+    if not rows:
+        return None, False
+    return rows[0]["bottle"], bool(rows[0]["claimed"])
+
+
+def _todays_view(birthday, view_date):
+    rows = (
+        supabase.table("bottle_views")
+        .select("bottle_id")
+        .eq("birthday", birthday)
+        .eq("view_date", view_date)
+        .limit(1)
+        .execute()
+        .data
+    )
+    return rows[0]["bottle_id"] if rows else None
+
+
+def _claim_with_queries(birthday, view_date):
+    bottle_id = _todays_view(birthday, view_date)
+    if bottle_id:
+        rows = supabase.table("bottles").select("*").eq("id", bottle_id).execute().data
+        return (rows[0] if rows else None), False
+
+    seen = {
+        r["bottle_id"]
+        for r in supabase.table("bottle_views").select("bottle_id").eq("birthday", birthday).execute().data or []
+    }
+    query = supabase.table("bottles").select("*").neq("birthday", birthday)
+    if seen:
+        query = query.not_.in_("id", list(seen))
+    rows = query.order("created_at", desc=False).limit(1).execute().data
+    if not rows:
+        return None, False
+
+    try:
+        supabase.table("bottle_views").insert({
+            "id": uuid.uuid4().hex,
+            "birthday": birthday,
+            "bottle_id": rows[0]["id"],
+            "view_date": view_date
+        }).execute()
+    except Exception:
+        # Lost the race to a concurrent request; its claim stands
+        if _todays_view(birthday, view_date) is None:
+            raise
+        return _claim_with_queries(birthday, view_date)
+    return rows[0], True
+
+
+def claim_bottle(birthday, view_date):
+    """
+    Today's bottle for this user as (bottle, claimed). `claimed` is True only
+    for the request that created the view. Repeat calls the same day are
+    answered from memory.
+    """
+    key = (birthday, view_date)
+    bottle = _claims.get(key)
+    if bottle is not None:
+        return bottle, False
+
+    try:
+        bottle, claimed = _claim_with_rpc(birthday, view_date)
+    except Exception as e:
+        print(f"[BOTTLE] rpc unavailable ({e}), claiming with queries")
+        bottle, claimed = _claim_with_queries(birthday, view_date)
+
+    # Only cache a hit: a bottle posted later today can still be claimed
+    if bottle is not None:
+        _claims.set(key, bottle)
+    return bottle, claimed
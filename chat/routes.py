@@ -4,20 +4,50 @@ from flask import (
     render_template,
     make_response,
     send_from_directory,
-    current_app
+    current_app,
+    abort,
+    url_for
 )
+from werkzeug.security import safe_join
 from datetime import datetime, date
 from zoneinfo import ZoneInfo
+import mimetypes
 import os
+import re
 import uuid
 
 from . import chat_bp
-from supabase_client import supabase
+from supabase_client import supabase, quote_filter_value
+from batch_writer import activity_writer
+from ttl_cache import TTLCache
+from parallel import FanOut, fan_out
+from image_variants import queue_local_variants, local_srcset
+from .bottle_assign import claim_bottle
+from .upload_store import save_upload, release_upload, UploadTooLarge, DEFAULT_MAX_UPLOAD_SIZE, FORM_OVERHEAD
 
 USER_BIRTHDAYS = ["030605", "ry5678"]
 
 MY_TZ = ZoneInfo("Asia/Kuala_Lumpur")
 
+# Message feed: only the columns message.html shows, a page at a time
+MESSAGE_COLUMNS = "id, time, birthday, text, file_path"
+MESSAGE_PAGE_SIZE = 30
+MESSAGE_MAX_PAGE = 100
+MESSAGE_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Uploads are immutable; let browsers and CDNs keep them for a year
+UPLOAD_CACHE_MAX_AGE = 31536000
+
+# How many of a user's bottles were picked by others, keyed by birthday
+picked_counts = TTLCache(ttl=300)
+
+# display_name by birthday (None = no such user); dropped when login creates a user
+user_cache = TTLCache(ttl=600, max_size=2048)
+_NOT_CACHED = object()
+
+# Dashboard stats per birthday; short-lived so counts stay close to live
+dashboard_cache = TTLCache(ttl=30)
+
 
 # ---------- Activity Logger ----------
 def log_activity(birthday, page):
@@ -25,15 +55,206 @@ def log_activity(birthday, page):
     Persist activity logs safely.
     - Store timezone-aware datetime
     - Supabase/Postgres will normalize to UTC internally
+    - Rows are queued and bulk-inserted by the background batch writer
     """
     now_my = datetime.now(MY_TZ).isoformat()
 
-    supabase.table("user_activity").insert({
+    activity_writer.submit({
         "id": uuid.uuid4().hex,
         "birthday": birthday,
         "page": page,
         "access_time": now_my
-    }).execute()
+    })
+
+
+# ---------- Users ----------
+def get_display_names(birthdays):
+    """
+    {birthday: display_name or None} for the given birthdays.
+    Keys are deduplicated and only cache misses hit Supabase, in one query.
+    """
+    names, missing = {}, []
+    for b in dict.fromkeys(birthdays):
+        cached = user_cache.get(b, _NOT_CACHED)
+        if cached is _NOT_CACHED:
+            missing.append(b)
+        else:
+            names[b] = cached
+
+    if missing:
+        users_resp = supabase.table("users").select("birthday, display_name").in_("birthday", missing).execute()
+        found = {u["birthday"]: u["display_name"] or "" for u in users_resp.data or []}
+        for b in missing:
+            names[b] = found.get(b)
+            user_cache.set(b, names[b])
+
+    return names
+
+
+def get_display_name(birthday):
+    return get_display_names([birthday]).get(birthday) or "User"
+
+
+# ---------- Bottle Stats ----------
+def get_picked_count(birthday):
+    """
+    Count bottle_views rows pointing at this user's bottles.
+    One fixed-size query: an inner join on bottles filtered by owner, counted
+    server-side; cached and bumped on new views.
+    """
+    cached = picked_counts.get(birthday)
+    if cached is not None:
+        return cached
+
+    count = (
+        supabase.table("bottle_views")
+        .select("id, bottles!inner(birthday)", count="exact", head=True)
+        .eq("bottles.birthday", birthday)
+        .execute()
+        .count or 0
+    )
+
+    picked_counts.set(birthday, count)
+    return count
+
+
+# ---------- Dashboard Data ----------
+def get_dashboard_data(birthday):
+    """
+    Everything the dashboard shows, fetched concurrently.
+    Counts are head-only exact counts, so responses stay constant-size.
+    """
+    cached = dashboard_cache.get(birthday)
+    if cached is not None:
+        return cached
+
+    def count_rows(table):
+        return (
+            supabase.table(table)
+            .select("id", count="exact", head=True)
+            .eq("birthday", birthday)
+            .execute()
+            .count or 0
+        )
+
+    def recent_activity():
+        return (
+            supabase.table("user_activity")
+            .select("page, access_time")
+            .eq("birthday", birthday)
+            .order("access_time", desc=True)
+            .limit(5)
+            .execute()
+            .data or []
+        )
+
+    data = fan_out({
+        "name": lambda: get_display_name(birthday),
+        "messages_count": lambda: count_rows("messages"),
+        "bottles_count": lambda: count_rows("bottles"),
+        "recent_activity": recent_activity
+    })
+
+    # Convert UTC → Malaysia time for display
+    for a in data["recent_activity"]:
+        dt = datetime.fromisoformat(a["access_time"])
+        a["access_time"] = (
+            dt.astimezone(MY_TZ)
+            .strftime("%Y-%m-%d %H:%M:%S")
+        )
+
+    dashboard_cache.set(birthday, data)
+    return data
+
+
+# ---------- Uploads ----------
+@chat_bp.before_request
+def limit_upload_size():
+    """Refuse oversized posts from Content-Length, before Werkzeug reads and spools the body."""
+    limit = current_app.config.get("MAX_UPLOAD_SIZE", DEFAULT_MAX_UPLOAD_SIZE) + FORM_OVERHEAD
+    if request.content_length and request.content_length > limit:
+        return "File too large", 413
+
+
+def save_posted_file():
+    """Store the request's `file` field (streamed, content-addressed). Returns its name or None."""
+    file = request.files.get("file")
+    if not (file and file.filename):
+        return None
+    folder = current_app.config["UPLOAD_FOLDER"]
+    filename = save_upload(file, folder, current_app.config.get("MAX_UPLOAD_SIZE", DEFAULT_MAX_UPLOAD_SIZE))
+    # Thumbnails are rendered in the image process pool, not on this thread
+    queue_local_variants(os.path.join(folder, filename))
+    return filename
+
+
+@chat_bp.app_template_global()
+def upload_srcset(filename):
+    """srcset for an uploaded image's resized variants ('' until they exist)."""
+    entries = local_srcset(current_app.config["UPLOAD_FOLDER"], filename)
+    return ", ".join(f"{url_for('chat.uploaded_file', filename=name)} {width}w" for name, width in entries)
+
+
+def count_file_references(file_path, exclude_message_id):
+    """Rows other than `exclude_message_id` that still point at an upload."""
+    counts = fan_out({
+        "messages": lambda: (
+            supabase.table("messages")
+            .select("id", count="exact", head=True)
+            .eq("file_path", file_path)
+            .eq("active", True)
+            .neq("id", exclude_message_id)
+            .execute()
+            .count or 0
+        ),
+        "bottles": lambda: (
+            supabase.table("bottles")
+            .select("id", count="exact", head=True)
+            .eq("file_path", file_path)
+            .execute()
+            .count or 0
+        )
+    })
+    return counts["messages"] + counts["bottles"]
+
+
+# ---------- Message Feed ----------
+def _message_cursor(m):
+    return {"time": m["time"], "id": m["id"]}
+
+
+def parse_message_cursor(t, i):
+    """Validate a (time, id) cursor from the query string; ValueError if malformed."""
+    if not MESSAGE_ID_RE.match(i or ""):
+        raise ValueError("invalid cursor id")
+    return datetime.fromisoformat(t).isoformat(), i
+
+
+def fetch_messages_page(before=None, after=None, limit=MESSAGE_PAGE_SIZE):
+    """
+    One keyset page of active messages, newest first, with display names.
+    `before` / `after` are (time, id) cursors; ties on time are broken by id.
+    """
+    query = supabase.table("messages").select(MESSAGE_COLUMNS).eq("active", True)
+
+    if before:
+        t, i = map(quote_filter_value, before)
+        query = query.or_(f"time.lt.{t},and(time.eq.{t},id.lt.{i})")
+    elif after:
+        t, i = map(quote_filter_value, after)
+        query = query.or_(f"time.gt.{t},and(time.eq.{t},id.gt.{i})")
+
+    # Newer-than pages are read oldest first so the limit keeps the closest ones
+    desc = not after
+    messages = query.order("time", desc=desc).order("id", desc=desc).limit(limit).execute().data or []
+    if after:
+        messages.reverse()
+
+    user_dict = get_display_names(m["birthday"] for m in messages)
+    for m in messages:
+        m["display_name"] = user_dict.get(m["birthday"]) or "Unknown"
+
+    return messages
 
 
 # ---------- Login ----------
@@ -46,14 +267,14 @@ def login():
             log_activity(f"unknown-{birthday}", "login_failed")
             return render_template("login.html", error="Invalid birthday")
 
-        user_resp = supabase.table("users").select("*").eq("birthday", birthday).execute()
-        user = user_resp.data[0] if user_resp.data else None
+        user_exists = get_display_names([birthday]).get(birthday) is not None
 
-        if not user:
+        if not user_exists:
             supabase.table("users").insert({
                 "birthday": birthday,
                 "display_name": "ry" if birthday == "ry5678" else "user"
             }).execute()
+            user_cache.pop(birthday)
 
         log_activity(birthday, "login_success")
 
@@ -73,20 +294,12 @@ def message():
 
     log_activity(birthday, "message")
 
-    user_resp = supabase.table("users").select("display_name").eq("birthday", birthday).execute()
-    name = user_resp.data[0]["display_name"] if user_resp.data else "User"
-
     if request.method == "POST":
         text = request.form.get("message")
-        file = request.files.get("file")
-        file_path = None
-
-        if file and file.filename:
-            ext = os.path.splitext(file.filename)[1]
-            filename = f"{uuid.uuid4().hex}{ext}"
-            save_path = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
-            file.save(save_path)
-            file_path = filename
+        try:
+            file_path = save_posted_file()
+        except UploadTooLarge:
+            return "File too large", 413
 
         if text or file_path:
             supabase.table("messages").insert({
@@ -97,33 +310,108 @@ def message():
                 "file_path": file_path,
                 "active": True
             }).execute()
+            dashboard_cache.pop(birthday)
 
         return redirect("/message")
 
-    messages_resp = (
-        supabase.table("messages")
-        .select("*")
-        .eq("active", True)
-        .order("time", desc=True)
-        .limit(500)
-        .execute()
+    # Display name and the first page are independent; fetch them together
+    results = (
+        FanOut()
+        .add("name", get_display_name, birthday, timeout=5, default="User")
+        .add("messages", fetch_messages_page)
+        .join()
+    )
+    name = results["name"]
+    messages = results["messages"]
+
+    return render_template(
+        "message.html",
+        name=name,
+        messages=messages,
+        older=_message_cursor(messages[-1]) if len(messages) == MESSAGE_PAGE_SIZE else None,
+        newest=_message_cursor(messages[0]) if messages else None
     )
-    messages = messages_resp.data or []
 
-    birthday_list = [m["birthday"] for m in messages]
-    users_resp = supabase.table("users").select("birthday, display_name").in_("birthday", birthday_list).execute()
-    user_dict = {u["birthday"]: u["display_name"] for u in users_resp.data} if users_resp.data else {}
 
-    for m in messages:
-        m["display_name"] = user_dict.get(m["birthday"], "Unknown")
+@chat_bp.route("/message/feed")
+def message_feed():
+    """
+    JSON pages of the message feed (newest first).
+    - ?before=<time>&before_id=<id>: the next older page
+    - ?after=<time>&after_id=<id>: messages newer than the cursor
+    """
+    birthday = request.cookies.get("birthday")
+    if not birthday:
+        return {"success": False, "error": "not logged in"}, 401
+
+    limit = min(max(request.args.get("limit", MESSAGE_PAGE_SIZE, type=int), 1), MESSAGE_MAX_PAGE)
+    before, after = request.args.get("before"), request.args.get("after")
+
+    try:
+        if after:
+            after = parse_message_cursor(after, request.args.get("after_id"))
+        elif before:
+            before = parse_message_cursor(before, request.args.get("before_id"))
+    except ValueError:
+        return {"success": False, "error": "invalid cursor"}, 400
+
+    try:
+        if after:
+            messages = fetch_messages_page(after=after, limit=limit)
+        elif before:
+            messages = fetch_messages_page(before=before, limit=limit)
+        else:
+            messages = fetch_messages_page(limit=limit)
+    except Exception as e:
+        print(f"[MESSAGE FEED ERROR] {e}")
+        return {"success": False, "error": str(e)}, 500
 
-    return render_template("message.html", name=name, messages=messages)
+    html = render_template("message_list.html", name=get_display_name(birthday), messages=messages)
+    return {
+        "success": True,
+        "html": html,
+        "count": len(messages),
+        "older": _message_cursor(messages[-1]) if len(messages) == limit and not after else None,
+        "newest": _message_cursor(messages[0]) if messages else None
+    }
 
 
 # ---------- Upload Serving ----------
 @chat_bp.route("/uploads/<filename>")
 def uploaded_file(filename):
-    return send_from_directory(current_app.config["UPLOAD_FOLDER"], filename)
+    """
+    Upload names never change content (sha256 or random UUID), so responses are
+    cacheable forever. Range requests and If-None-Match are handled by
+    send_from_directory; UPLOAD_SENDFILE_MODE = "x-accel" hands the bytes to nginx
+    (or set USE_X_SENDFILE for Apache/lighttpd).
+    """
+    folder = current_app.config["UPLOAD_FOLDER"]
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    # Content-addressed names (and their variants) double as strong ETags;
+    # legacy UUID names fall back to Werkzeug's
+    etag = filename if len(filename.split(".", 1)[0]) == 64 else True
+
+    if etag is not True and request.if_none_match.contains(etag):
+        resp = make_response("", 304)
+        resp.set_etag(etag)
+    elif current_app.config.get("UPLOAD_SENDFILE_MODE") == "x-accel":
+        resp = make_response("")
+        resp.headers["X-Accel-Redirect"] = current_app.config.get("UPLOAD_ACCEL_PREFIX", "/protected-uploads/") + filename
+        resp.mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        if etag is not True:
+            resp.set_etag(etag)
+    else:
+        resp = send_from_directory(folder, filename, etag=etag, conditional=True, max_age=UPLOAD_CACHE_MAX_AGE)
+
+    # send_file marks responses no-cache when no max_age is configured; never for uploads
+    resp.cache_control.no_cache = None
+    resp.cache_control.public = True
+    resp.cache_control.max_age = UPLOAD_CACHE_MAX_AGE
+    resp.cache_control.immutable = True
+    return resp
 
 
 # ---------- Dashboard ----------
@@ -135,42 +423,14 @@ def dashboard():
 
     log_activity(birthday, "dashboard")
 
-    user_resp = supabase.table("users").select("display_name").eq("birthday", birthday).execute()
-    name = user_resp.data[0]["display_name"] if user_resp.data else "User"
-
-    messages_count = len(
-        supabase.table("messages").select("id").eq("birthday", birthday).execute().data or []
-    )
-
-    bottles_count = len(
-        supabase.table("bottles").select("id").eq("birthday", birthday).execute().data or []
-    )
-
-    recent_activity = (
-        supabase.table("user_activity")
-        .select("page, access_time")
-        .eq("birthday", birthday)
-        .order("access_time", desc=True)
-        .limit(5)
-        .execute()
-        .data or []
-    )
-
-    # Convert UTC → Malaysia time for display
-    for a in recent_activity:
-        dt = datetime.fromisoformat(a["access_time"])
-        a["access_time"] = (
-            dt.astimezone(MY_TZ)
-            .strftime("%Y-%m-%d %H:%M:%S")
-        )
-
+    data = get_dashboard_data(birthday)
 
     return render_template(
         "dashboard.html",
-        name=name,
-        messages_count=messages_count,
-        bottles_count=bottles_count,
-        recent_activity=recent_activity
+        name=data["name"],
+        messages_count=data["messages_count"],
+        bottles_count=data["bottles_count"],
+        recent_activity=data["recent_activity"]
     )
 
 
@@ -186,15 +446,10 @@ def bottle():
 
     if request.method == "POST":
         text = request.form.get("message")
-        file = request.files.get("file")
-        file_path = None
-
-        if file and file.filename:
-            ext = os.path.splitext(file.filename)[1]
-            filename = f"{uuid.uuid4().hex}{ext}"
-            save_path = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
-            file.save(save_path)
-            file_path = filename
+        try:
+            file_path = save_posted_file()
+        except UploadTooLarge:
+            return "File too large", 413
 
         if text or file_path:
             supabase.table("bottles").insert({
@@ -204,48 +459,18 @@ def bottle():
                 "file_path": file_path,
                 "created_at": datetime.now(MY_TZ)
             }).execute()
+            dashboard_cache.pop(birthday)
 
-    view_resp = (
-        supabase.table("bottle_views")
-        .select("*")
-        .eq("birthday", birthday)
-        .eq("view_date", today_str)
-        .execute()
-    )
-    view = view_resp.data[0] if view_resp.data else None
-
-    bottle_to_show = None
-    no_bottle = False
-
-    if view:
-        bottle_to_show = supabase.table("bottles").select("*").eq("id", view["bottle_id"]).execute().data[0]
-    else:
-        bottle_resp = (
-            supabase.table("bottles")
-            .select("*")
-            .neq("birthday", birthday)
-            .order("created_at", desc=False)
-            .limit(1)
-            .execute()
-        )
-        bottle_to_show = bottle_resp.data[0] if bottle_resp.data else None
+    # The picked count doesn't depend on today's bottle; run it alongside
+    stats = FanOut().add("picked_count", get_picked_count, birthday, timeout=5, default=0)
 
-        if bottle_to_show:
-            supabase.table("bottle_views").insert({
-                "id": uuid.uuid4().hex,
-                "birthday": birthday,
-                "bottle_id": bottle_to_show["id"],
-                "view_date": today_str
-            }).execute()
-        else:
-            no_bottle = True
+    bottle_to_show, claimed = claim_bottle(birthday, today_str)
+    if claimed:
+        # Keep the owner's cached picked count in step
+        picked_counts.incr(bottle_to_show["birthday"])
+    no_bottle = bottle_to_show is None
 
-    picked_count = 0
-    picked_resp = supabase.table("bottle_views").select("*").execute()
-    for p in picked_resp.data or []:
-        b = supabase.table("bottles").select("birthday").eq("id", p["bottle_id"]).execute()
-        if b.data and b.data[0]["birthday"] == birthday:
-            picked_count += 1
+    picked_count = stats.join()["picked_count"]
 
     return render_template(
         "bottle.html",
@@ -267,10 +492,13 @@ def delete_message():
     msg_resp = supabase.table("messages").select("*").eq("id", message_id).eq("birthday", birthday).execute()
     msg = msg_resp.data[0] if msg_resp.data else None
 
-    if msg and msg.get("file_path"):
-        path = os.path.join(current_app.config["UPLOAD_FOLDER"], msg["file_path"])
-        if os.path.exists(path):
-            os.remove(path)
-
     supabase.table("messages").update({"active": False}).eq("id", message_id).eq("birthday", birthday).execute()
+
+    # Uploads are deduplicated, so only unlink the file when this was the last reference
+    if msg and msg.get("file_path"):
+        release_upload(
+            msg["file_path"],
+            current_app.config["UPLOAD_FOLDER"],
+            count_file_references(msg["file_path"], message_id)
+        )
     return redirect("/message")
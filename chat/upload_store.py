@@ -0,0 +1,81 @@
+# chat/upload_store.py
+import hashlib
+import os
+import re
+import tempfile
+
+from image_variants import VARIANT_WIDTHS, variant_name
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_UPLOAD_SIZE = 50 * 1024 * 1024  # override with app.config["MAX_UPLOAD_SIZE"]
+FORM_OVERHEAD = 1024 * 1024  # multipart boundaries and text fields on top of the file
+
+_EXT_RE = re.compile(r"^\.[A-Za-z0-9]{1,10}$")
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def _clean_ext(filename):
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if _EXT_RE.match(ext) else ""
+
+
+def save_upload(file, folder, max_size=DEFAULT_MAX_UPLOAD_SIZE):
+    """
+    Stream an uploaded file to disk and store it content-addressed.
+    - Read in chunks, hashing as we go, so memory stays flat
+    - Abort with UploadTooLarge once `max_size` bytes are exceeded
+    - Write to a temp file in `folder`, then rename, so readers never see partial files
+    - Identical content maps to the same name and is stored once; the rename
+      always happens, so a copy unlinked by a concurrent delete is restored
+    Returns the stored filename (sha256 + original extension).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".upload-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = file.stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_size and size > max_size:
+                    raise UploadTooLarge(f"Upload exceeds {max_size} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+
+        filename = f"{digest.hexdigest()}{_clean_ext(file.filename)}"
+        target = os.path.join(folder, filename)
+        # Same bytes as any existing copy, so replacing it is harmless
+        os.replace(tmp_path, target)
+        return filename
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def release_upload(filename, folder, reference_count):
+    """
+    Unlink a stored upload once nothing references it any more.
+    `reference_count` is the number of OTHER rows still pointing at the file.
+    Not atomic with new uploads: a save_upload() of the same content that
+    lands between the count query and the unlink (its row not yet counted)
+    is left pointing at a missing file. save_upload() always rewrites the
+    file, so that narrow window is the only one left.
+    """
+    if reference_count > 0:
+        return False
+    name = os.path.basename(filename)
+    # The original plus any resized variants generated for it
+    for path in [name] + [variant_name(name, w) for w in VARIANT_WIDTHS]:
+        try:
+            os.remove(os.path.join(folder, path))
+        except FileNotFoundError:
+            pass
+    return True
@@ -0,0 +1,31 @@
+# gunicorn.conf.py
+# Picked up automatically by `gunicorn main:app` when run from this directory.
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# /api/stream (SSE) keeps a request open; with sync workers one open tab
+# would block the whole worker. gthread gives each worker a thread pool.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# gthread workers heartbeat from their main loop, so a long SSE handler is fine;
+# a sync worker is killed after `timeout`, so its streams must end well before
+if worker_class == "sync":
+    os.environ.setdefault("SSE_MAX_AGE", str(timeout - 10))
+
+# With --preload the app is built in the master before forking; a warmup thread
+# there could hold a cache lock at fork and leave it locked in every worker.
+# create_app() leaves warmup to this hook, which runs inside each worker.
+os.environ["APP_WARMUP_IN_WORKER"] = "1"
+
+
+def post_worker_init(worker):
+    if os.getenv("APP_WARMUP", "1") == "1":
+        import main
+        main.start_warmup()
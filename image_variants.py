@@ -0,0 +1,152 @@
+# image_variants.py
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it originals are served as-is
+    Image = None
+
+VARIANT_WIDTHS = (320, 800, 1600)
+VARIANT_FORMAT = "webp"
+VARIANT_QUALITY = 80
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}  # gifs keep their animation
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+VARIANT_MARKER = ".v"
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def enabled():
+    return Image is not None
+
+
+def is_image(filename):
+    return os.path.splitext(filename or "")[1].lower() in IMAGE_EXTENSIONS
+
+
+def mark_for_variants(filename):
+    """
+    'abc.jpg' -> 'abc.v.jpg' when variants will be generated for it. Storage
+    objects can't be listed cheaply, so the name tells clients a srcset exists.
+    """
+    if not (enabled() and is_image(filename)):
+        return filename
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}{VARIANT_MARKER}{ext}"
+
+
+def variant_name(filename, width):
+    """'abc.jpg' -> 'abc.w320.webp' (also works on storage paths and URLs)"""
+    return f"{os.path.splitext(filename)[0]}.w{width}.{VARIANT_FORMAT}"
+
+
+# ---------- Worker-side (runs in the process pool) ----------
+def render_variants(data):
+    """Resize and re-encode image bytes. Returns {width: webp bytes}."""
+    variants = {}
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+        for width in VARIANT_WIDTHS:
+            copy = img.copy()
+            copy.thumbnail((width, width * 4))  # never upscales
+            buf = io.BytesIO()
+            copy.save(buf, VARIANT_FORMAT, quality=VARIANT_QUALITY, method=4)
+            variants[width] = buf.getvalue()
+    return variants
+
+
+def write_local_variants(path):
+    """Write variants next to a local upload (atomically). Returns the widths written."""
+    folder = os.path.dirname(path)
+    targets = {w: os.path.join(folder, variant_name(os.path.basename(path), w)) for w in VARIANT_WIDTHS}
+    if all(os.path.exists(t) for t in targets.values()):
+        return list(targets)  # deduplicated upload, already processed
+
+    with open(path, "rb") as f:
+        variants = render_variants(f.read())
+
+    for width, data in variants.items():
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".variant-", suffix=".part")
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        os.replace(tmp_path, targets[width])
+    return list(variants)
+
+
+# ---------- Request-side ----------
+def _get_pool():
+    # One pool per worker process so resizing never blocks request threads
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                # Never fork this process: its batch writer, fan-out and httpx
+                # threads may hold locks the child would inherit
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                _pool = ProcessPoolExecutor(
+                    max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context(method)
+                )
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def _log_failure(label):
+    def callback(future):
+        if future.exception() is not None:
+            print(f"[IMAGE VARIANTS] {label} failed: {future.exception()}")
+    return callback
+
+
+def queue_local_variants(path):
+    """Schedule thumbnail generation for a local upload; no-op for non-images or without Pillow."""
+    if not (enabled() and is_image(path)):
+        return None
+    future = _get_pool().submit(write_local_variants, path)
+    future.add_done_callback(_log_failure(os.path.basename(path)))
+    return future
+
+
+def queue_storage_variants(data, storage_path, bucket):
+    """
+    Schedule variants for an image uploaded to Supabase Storage.
+    Resizing happens in the process pool; the uploads run on a background thread.
+    """
+    if not (enabled() and is_image(storage_path)):
+        return None
+
+    def upload_when_ready():
+        try:
+            variants = _get_pool().submit(render_variants, data).result()
+            for width, variant in variants.items():
+                bucket.upload(
+                    path=variant_name(storage_path, width),
+                    file=variant,
+                    file_options={"content-type": f"image/{VARIANT_FORMAT}", "upsert": "true"}
+                )
+        except Exception as e:
+            print(f"[IMAGE VARIANTS] {storage_path} failed: {e}")
+
+    thread = threading.Thread(target=upload_when_ready, name="storage-variants", daemon=True)
+    thread.start()
+    return thread
+
+
+def local_srcset(folder, filename):
+    """(name, width) pairs for a local upload's variants that already exist on disk."""
+    if not (filename and is_image(filename)):
+        return []
+    entries = []
+    for width in VARIANT_WIDTHS:
+        name = variant_name(filename, width)
+        if os.path.exists(os.path.join(folder, name)):
+            entries.append((name, width))
+    return entries
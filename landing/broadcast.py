@@ -0,0 +1,45 @@
+# landing/broadcast.py
+import queue
+import threading
+
+
+class Broadcaster:
+    """
+    In-process fan-out of change notifications to open SSE streams.
+    Each subscriber gets its own small queue; a slow subscriber just misses
+    wake-ups (it re-checks the snapshots on its next tick anyway).
+    """
+
+    def __init__(self, queue_size=16):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self, limit=None):
+        """A new subscriber queue, or None if `limit` subscribers are already open."""
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            if limit is not None and len(self._subscribers) >= limit:
+                return None
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, topic):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(topic)
+            except queue.Full:
+                pass
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+broadcaster = Broadcaster()
@@ -0,0 +1,208 @@
+# landing/feed_cache.py
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request
+
+from supabase_client import supabase
+from landing.message_cache import message_cache
+from landing.broadcast import broadcaster
+from landing.page_cache import page_cache
+
+CHRONICLE_CACHE_TTL = 60  # seconds; admin writes invalidate immediately anyway
+CHRONICLE_PAGE_SIZE = 20
+CHRONICLE_HISTORY = 20    # past feed versions kept for computing deltas
+
+# Bumped by mark_changed() whenever the admin blueprint writes a topic
+_versions = {"ui_messages": 0, "chronicle": 0}
+_versions_lock = threading.Lock()
+
+
+# ---------- Pre-serialized payloads ----------
+class JsonSnapshot:
+    """A payload serialized once, with a strong ETag derived from its bytes."""
+
+    def __init__(self, data):
+        self.data = data
+        self.body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = hashlib.sha1(self.body).hexdigest()
+
+
+def json_response(snapshot):
+    """Serve a snapshot, answering If-None-Match with a bodiless 304."""
+    if request.if_none_match.contains(snapshot.etag):
+        resp = current_app.response_class(status=304)
+    else:
+        resp = current_app.response_class(snapshot.body, mimetype="application/json")
+    resp.set_etag(snapshot.etag)
+    # Let browsers keep the body but always revalidate
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+class SnapshotCache:
+    """Holds one JsonSnapshot, rebuilt when its topic version changes or the TTL expires."""
+
+    def __init__(self, topic, loader, ttl):
+        self.topic = topic
+        self.loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = None
+        self._loaded_at = 0.0
+
+    def _fresh(self):
+        return (
+            self._snapshot is not None
+            and self._version == _versions[self.topic]
+            and time.monotonic() - self._loaded_at < self.ttl
+        )
+
+    def get(self):
+        if self._fresh():
+            return self._snapshot
+        with self._lock:
+            if self._fresh():
+                return self._snapshot
+            version = _versions[self.topic]
+            try:
+                self._snapshot = JsonSnapshot(self.loader())
+            except Exception as e:
+                # Serve the last good snapshot if Supabase hiccups
+                if self._snapshot is None:
+                    raise
+                print(f"Failed to refresh {self.topic} snapshot: {e}")
+            self._version = version
+            self._loaded_at = time.monotonic()
+            return self._snapshot
+
+
+# ---------- Change notification ----------
+def mark_changed(topic):
+    """Called by admin write routes so cached payloads are rebuilt on the next read."""
+    with _versions_lock:
+        _versions[topic] += 1
+    if topic == "ui_messages":
+        message_cache.invalidate()
+    # Pages rendered from the old data are keyed on its version; drop them now
+    page_cache.clear()
+    # Wake up open SSE streams so they push the new payload
+    broadcaster.publish(topic)
+
+
+def version(topic):
+    return _versions[topic]
+
+
+# ---------- Chronicle ----------
+def _load_chronicle():
+    resp = supabase.table("chronicle_posts")\
+        .select("*")\
+        .eq("is_active", True)\
+        .order("created_at", desc=False).execute()
+    return {"success": True, "posts": resp.data or []}
+
+
+chronicle_snapshot = SnapshotCache("chronicle", _load_chronicle, CHRONICLE_CACHE_TTL)
+
+
+# ---------- Incremental chronicle feed ----------
+# chronicle_posts has no updated_at column, so edits and removals can't be
+# found with a DB cursor. Instead each feed version (the snapshot ETag) is
+# remembered as {id: post} and deltas are diffed in memory.
+_chronicle_history = OrderedDict()
+_chronicle_deltas = {}
+_chronicle_lock = threading.Lock()
+
+
+def chronicle_state():
+    """Current chronicle snapshot, registered in the version history."""
+    snapshot = chronicle_snapshot.get()
+    if snapshot.etag not in _chronicle_history:
+        with _chronicle_lock:
+            if snapshot.etag not in _chronicle_history:
+                _chronicle_history[snapshot.etag] = {
+                    str(p["id"]): p for p in snapshot.data["posts"]
+                }
+                while len(_chronicle_history) > CHRONICLE_HISTORY:
+                    _chronicle_history.popitem(last=False)
+                # Deltas towards older versions are no longer useful
+                _chronicle_deltas.clear()
+    return snapshot
+
+
+def _page_cursor(post):
+    return {"before": post["created_at"], "before_id": str(post["id"])}
+
+
+def chronicle_page(before=None, before_id=None, limit=CHRONICLE_PAGE_SIZE):
+    """
+    Keyset page of active posts (oldest first within the page) ending just
+    before the (created_at, id) cursor, or the latest page when no cursor.
+    """
+    snapshot = chronicle_state()
+    posts = snapshot.data["posts"]
+
+    end = len(posts)
+    if before is not None:
+        ids = [str(p["id"]) for p in posts]
+        if before_id is not None and before_id in ids:
+            end = ids.index(before_id)
+        else:
+            end = sum(1 for p in posts if p["created_at"] < before)
+
+    start = max(end - limit, 0)
+    page = posts[start:end]
+    return {
+        "success": True,
+        "version": snapshot.etag,
+        "posts": page,
+        "older": _page_cursor(page[0]) if page and start > 0 else None
+    }
+
+
+def chronicle_delta(since):
+    """
+    Changes between feed version `since` and now, as a JsonSnapshot.
+    Unknown (expired) versions get a reset carrying the latest page.
+    """
+    snapshot = chronicle_state()
+    old = _chronicle_history.get(since)
+    # `since` comes from the query string: unknown values all share one reset
+    # entry, so the cache stays bounded by the history size
+    key = (since, snapshot.etag) if old is not None else ("reset", snapshot.etag)
+    delta = _chronicle_deltas.get(key)
+    if delta is not None:
+        return delta
+
+    if old is None:
+        payload = chronicle_page()
+        payload["reset"] = True
+    else:
+        new = _chronicle_history[snapshot.etag]
+        payload = {
+            "success": True,
+            "version": snapshot.etag,
+            "upserts": [p for post_id, p in new.items() if old.get(post_id) != p],
+            "removed": [post_id for post_id in old if post_id not in new]
+        }
+
+    delta = JsonSnapshot(payload)
+    with _chronicle_lock:
+        _chronicle_deltas[key] = delta
+    return delta
+
+
+def chronicle_version_snapshot():
+    """Tiny {"version": ...} payload pushed over SSE; clients then pull the delta."""
+    snapshot = chronicle_state()
+    delta = _chronicle_deltas.get((None, snapshot.etag))
+    if delta is None:
+        delta = JsonSnapshot({"version": snapshot.etag})
+        with _chronicle_lock:
+            _chronicle_deltas[(None, snapshot.etag)] = delta
+    return delta
@@ -0,0 +1,98 @@
+# landing/message_cache.py
+import threading
+import time
+from bisect import bisect_right
+
+from supabase_client import supabase
+
+MESSAGE_CACHE_TTL = 300  # seconds; admin writes invalidate immediately anyway
+
+
+def _to_minute(value):
+    """'20:35' or '20:35:00' -> 1235"""
+    hours, minutes = str(value).split(":")[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+class MessageWindowIndex:
+    """
+    Active ui_messages precompiled into sorted, non-overlapping segments.
+    Each segment [bounds[i], bounds[i+1]) maps to the (greeting, ps) that
+    the old linear scan would have picked, so lookups are a single bisect.
+    """
+
+    def __init__(self, messages):
+        windows = []
+        for m in messages:
+            try:
+                start, end = _to_minute(m["start_time"]), _to_minute(m["end_time"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if start < end:
+                windows.append((start, end, m.get("message_type"), m.get("content")))
+
+        self.bounds = sorted({0, 24 * 60} | {w[0] for w in windows} | {w[1] for w in windows})
+        self.segments = []
+        for seg_start in self.bounds[:-1]:
+            greeting, ps = None, None
+            # Later rows win, same as the original scan order
+            for start, end, message_type, content in windows:
+                if start <= seg_start < end:
+                    if message_type == "greeting":
+                        greeting = content
+                    elif message_type == "ps":
+                        ps = content
+            self.segments.append((greeting, ps))
+
+        # Serialized /current_messages payloads, filled lazily per segment
+        self.snapshots = {}
+
+    def segment_at(self, minute):
+        i = bisect_right(self.bounds, minute) - 1
+        return min(max(i, 0), len(self.segments) - 1)
+
+    def lookup(self, minute):
+        return self.segments[self.segment_at(minute)]
+
+    def next_change(self, minute):
+        """Minute of day at which the lookup result may next change."""
+        i = bisect_right(self.bounds, minute)
+        return self.bounds[i] if i < len(self.bounds) else 24 * 60
+
+
+class MessageCache:
+    """Process-wide cache of the window index, refreshed on a TTL or on invalidate()."""
+
+    def __init__(self, ttl=MESSAGE_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._index = None
+        self._loaded_at = None
+
+    def _fresh(self):
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def index(self):
+        if self._fresh():
+            return self._index
+        with self._lock:
+            if self._fresh():
+                return self._index
+            try:
+                resp = supabase.table("ui_messages").select("*").eq("active", True).execute()
+                self._index = MessageWindowIndex(resp.data or [])
+                self._loaded_at = time.monotonic()
+            except Exception as e:
+                # Keep serving the last good index if Supabase hiccups
+                if self._index is None:
+                    raise
+                print(f"Failed to refresh ui_messages cache: {e}")
+                self._loaded_at = time.monotonic()
+            return self._index
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+message_cache = MessageCache()
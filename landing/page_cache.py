@@ -0,0 +1,81 @@
+# landing/page_cache.py
+import gzip
+import hashlib
+import os
+import threading
+
+from flask import current_app, render_template, request
+
+# Store a gzip copy next to the HTML so compressing costs nothing per hit
+PAGE_CACHE_GZIP = os.getenv("PAGE_CACHE_GZIP", "1") == "1"
+GZIP_LEVEL = 6
+
+
+class RenderedPage:
+    """A template rendered once, with its ETag and optional gzip body."""
+
+    def __init__(self, html):
+        self.body = html.encode("utf-8")
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        self.gzipped = gzip.compress(self.body, GZIP_LEVEL) if PAGE_CACHE_GZIP else None
+
+
+class PageCache:
+    """
+    One rendered page per (template, variant) slot, tagged with the data
+    version it was rendered from. Admin writes go through mark_changed(),
+    which moves the version on, so the next hit re-renders and replaces
+    the slot. The variant only picks the slot; whatever differs between
+    variants (e.g. admin_preview) must be passed in the context.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pages = {}
+        self.stats = {"hits": 0, "renders": 0}
+
+    def get(self, template, version, variant="public"):
+        """The cached page if it was rendered from `version`, else None."""
+        cached = self._pages.get((template, variant))
+        if cached is None or cached[0] != version:
+            return None
+        with self._lock:
+            self.stats["hits"] += 1
+        return cached[1]
+
+    def render(self, template, version, variant="public", **context):
+        """Cached page for `version`, rendering and storing it on a miss."""
+        page = self.get(template, version, variant)
+        if page is not None:
+            return page
+
+        page = RenderedPage(render_template(template, **context))
+        with self._lock:
+            self._pages[(template, variant)] = (version, page)
+            self.stats["renders"] += 1
+        return page
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+
+def page_response(page):
+    """Serve a rendered page: 304 on a matching ETag, the gzip body when accepted."""
+    # Each content-coding is its own representation, so it gets its own strong ETag
+    gzipped = page.gzipped is not None and "gzip" in request.accept_encodings
+    etag = page.etag + "-gz" if gzipped else page.etag
+    if request.if_none_match.contains(etag):
+        resp = current_app.response_class(status=304)
+    elif gzipped:
+        resp = current_app.response_class(page.gzipped, mimetype="text/html")
+        resp.headers["Content-Encoding"] = "gzip"
+    else:
+        resp = current_app.response_class(page.body, mimetype="text/html")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+
+page_cache = PageCache()
@@ -1,11 +1,37 @@
-from flask import Blueprint, render_template, request
+from flask import Blueprint, Response, current_app, render_template, request
 from datetime import datetime
 from zoneinfo import ZoneInfo
+import os
+import queue
+import time
 import uuid
-from supabase_client import supabase
+from batch_writer import visit_writer
+from landing.message_cache import message_cache
+from landing.feed_cache import (
+    JsonSnapshot,
+    json_response,
+    chronicle_snapshot,
+    chronicle_state,
+    chronicle_page,
+    chronicle_delta,
+    chronicle_version_snapshot,
+    CHRONICLE_PAGE_SIZE
+)
+from landing.broadcast import broadcaster
+from landing.page_cache import page_cache, page_response
+from landing import bot_filter
 
 ALLOWED_BIRTHDAYS = ["030605", "ry5678"]
 
+SSE_KEEPALIVE = 10    # seconds between keepalive comments
+# Streams end after this and EventSource reconnects. Under gthread a long handler
+# doesn't trip gunicorn's timeout, so idle tabs stay connected for minutes;
+# gunicorn.conf.py lowers it for sync workers, where it does
+SSE_MAX_AGE = int(os.getenv("SSE_MAX_AGE", "600"))
+SSE_RETRY_MS = 3000
+# Each open stream holds a worker thread; past this the page falls back to polling
+SSE_MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", "8"))
+
 landing_bp = Blueprint(
     "landing",
     __name__,
@@ -13,44 +39,77 @@ landing_bp = Blueprint(
 )
 
 # ---------- Visit Logger ----------
+def client_ip():
+    """
+    The visitor's address. Behind a proxy a request without X-Forwarded-For
+    only tells us the proxy's, so it resolves to None.
+    """
+    if current_app.config.get("PROXY_FIX_X_FOR") and not request.headers.get("X-Forwarded-For"):
+        return None
+    return request.remote_addr
+
+
 def log_visit(page="unknown", extra_info=None):
+    """Queue a visit row; the batch writer inserts it off the request thread."""
     try:
+        user_agent = request.headers.get("User-Agent")
+        page = f"{page}{('-'+extra_info) if extra_info else ''}"
+
+        # Crawlers and link previews are dropped (or tagged) before they cost a write;
+        # the per-IP rate rule is skipped when there is no trusted client IP to key on
+        if bot_filter.classify(user_agent, client_ip()):
+            if bot_filter.BOT_FILTER_MODE == "drop":
+                return
+            page = f"bot-{page}"
+
         malaysia_time = datetime.now(ZoneInfo("Asia/Kuala_Lumpur"))
         malaysia_time_str = malaysia_time.isoformat(timespec="seconds")
         log_data = {
             "id": uuid.uuid4().hex,
             "ip": request.remote_addr,
-            "user_agent": request.headers.get("User-Agent"),
-            "page": f"{page}{('-'+extra_info) if extra_info else ''}",
+            "user_agent": user_agent,
+            "page": page,
             "visit_time": malaysia_time_str
         }
-        supabase.table("visits").insert(log_data).execute()
+        visit_writer.submit(log_data)
     except Exception as e:
         print(f"Failed to log visit: {e}")
 
 # ---------- Fetch greeting/PS ----------
-def get_landing_messages():
+DEFAULT_GREETING = "nothing here yet.. come back later..?🫣"
+DEFAULT_PS = "haha, dk when will update on it.🫨"
+
+
+def _current_minute():
     now = datetime.now(ZoneInfo("Asia/Kuala_Lumpur"))
-    current_time = now.strftime("%H:%M")  # e.g., "20:35"
+    return now.hour * 60 + now.minute
 
-    resp = supabase.table("ui_messages").select("*").eq("active", True).execute()
-    messages = resp.data
 
-    greeting, ps = None, None
-    for m in messages:
-        if m["start_time"] <= current_time < m["end_time"]:
-            if m["message_type"] == "greeting":
-                greeting = m["content"]
-            elif m["message_type"] == "ps":
-                ps = m["content"]
+def _seconds_until_window_change():
+    now = datetime.now(ZoneInfo("Asia/Kuala_Lumpur"))
+    minute = now.hour * 60 + now.minute
+    next_minute = message_cache.index().next_change(minute)
+    return (next_minute - minute) * 60 - now.second
+
+
+def get_landing_messages():
+    # Served from the cached window index; only a TTL expiry or admin write hits Supabase
+    greeting, ps = message_cache.index().lookup(_current_minute())
 
     # fallback
-    if not greeting:
-        greeting = "nothing here yet.. come back later..?🫣"
-    if not ps:
-        ps = "haha, dk when will update on it.🫨"
+    return greeting or DEFAULT_GREETING, ps or DEFAULT_PS
 
-    return greeting, ps
+
+def get_messages_snapshot():
+    """Pre-serialized greeting/PS payload for the current time window."""
+    index = message_cache.index()
+    i = index.segment_at(_current_minute())
+    snapshot = index.snapshots.get(i)
+    if snapshot is None:
+        greeting, ps = index.segments[i]
+        snapshot = JsonSnapshot({"greeting": greeting or DEFAULT_GREETING, "ps": ps or DEFAULT_PS})
+        index.snapshots[i] = snapshot
+    return snapshot
 
 # ---------- Landing Route ----------
 @landing_bp.route("/", methods=["GET", "POST"])
@@ -60,8 +119,6 @@ def landing():
     
     admin_preview = request.args.get("admin_preview") == "1"
 
-    greeting_text, ps_text = get_landing_messages()
-
     if request.method == "POST":
         birthday = request.form.get("birthday", "").strip()
         if birthday in ALLOWED_BIRTHDAYS:
@@ -74,56 +131,76 @@ def landing():
     
     if not admin_preview:
         log_visit("landing")
-        
-    return render_template(
+
+    # The page only changes with the greeting/PS window, so render it once per payload.
+    # ?admin_preview=1 only skips logging here; the unlocked preview is admin.landing_preview
+    snapshot = get_messages_snapshot()
+    page = page_cache.render(
         "landing.html",
+        snapshot.etag,
         birthday_verified=birthday_verified,
         error=error,
-        greeting_text=greeting_text,
-        ps_text=ps_text
+        greeting_text=snapshot.data["greeting"],
+        ps_text=snapshot.data["ps"]
     )
+    return page_response(page)
 
 @landing_bp.route("/current_messages")
 def current_messages():
-    """Return current greeting and PS in JSON."""
-    greeting, ps = get_landing_messages()
-    return {"greeting": greeting, "ps": ps}
+    """Return current greeting and PS in JSON (304 if the client already has it)."""
+    return json_response(get_messages_snapshot())
 
 @landing_bp.route("/chronicle")
 def chronicle():
     # 1. Check for admin preview flag
     admin_preview = request.args.get("admin_preview") == "1"
 
-    # 2. Fetch Chronicle data from Supabase
+    # 2. Log visit only if NOT in admin preview
+    if not admin_preview:
+        log_visit("chronicle-view")
+
+    # 3. Rendered page for the current feed version (re-rendered after admin writes)
     try:
-        resp = supabase.table("chronicle_posts")\
-            .select("*")\
-            .eq("is_active", True)\
-            .order("created_at", desc=False).execute()
-        posts = resp.data or []
+        feed_version = chronicle_state().etag
     except Exception as e:
         print(f"Error fetching chronicle: {e}")
-        posts = []
+        initial_page = {"success": False, "version": None, "posts": [], "older": None}
+        return render_template(
+            "chronicle.html",
+            posts=initial_page["posts"],
+            initial_page=initial_page
+        )
 
-    # 3. Log visit only if NOT in admin preview
-    if not admin_preview:
-        log_visit("chronicle-view")
-
-    return render_template(
-        "chronicle.html",
-        posts=posts,
-        admin_preview=admin_preview
-    )
+    # Always the public page; the preview (no session check) is admin.chronicle_preview
+    page = page_cache.get("chronicle.html", feed_version)
+    if page is None:
+        initial_page = chronicle_page()
+        page = page_cache.render(
+            "chronicle.html",
+            initial_page["version"],
+            posts=initial_page["posts"],
+            initial_page=initial_page
+        )
+    return page_response(page)
 
 @landing_bp.route("/api/chronicle-updates")
 def get_chronicle_updates():
-    # Fetch active posts, ordered by created_at (Oldest first for chat flow)
+    """
+    Active posts, oldest first for chat flow.
+    - no args: the full feed (pre-serialized, ETag-validated)
+    - ?since=<version>: only upserted/removed posts since that version
+    - ?before=<created_at>&before_id=<id>: the next older page
+    """
     try:
-        resp = supabase.table("chronicle_posts")\
-            .select("*")\
-            .eq("is_active", True)\
-            .order("created_at", desc=False).execute()
-        return {"success": True, "posts": resp.data or []}
+        since = request.args.get("since")
+        before = request.args.get("before")
+
+        if since:
+            return json_response(chronicle_delta(since))
+        if before:
+            limit = min(request.args.get("limit", CHRONICLE_PAGE_SIZE, type=int), 100)
+            return chronicle_page(before, request.args.get("before_id"), max(limit, 1))
+        return json_response(chronicle_snapshot.get())
     except Exception as e:
         return {"success": False, "error": str(e)}, 500
     
@@ -132,4 +209,67 @@ def track_click():
     action = request.json.get("action")
     target = request.json.get("target") # e.g., "image", "spotify", "video"
     log_visit(f"click-{action}", extra_info=target)
-    return {"success": True}
\ No newline at end of file
+    return {"success": True}
+
+# ---------- Server-Sent Events ----------
+STREAM_TOPICS = {
+    "messages": get_messages_snapshot,
+    "chronicle": chronicle_version_snapshot,
+}
+
+
+def _event_stream(topics, q):
+    """
+    Push a topic's payload whenever its snapshot ETag changes.
+    Wakes up on admin writes (broadcaster), on greeting/PS window boundaries,
+    and every SSE_KEEPALIVE seconds so changes made by other workers still land.
+    """
+    sent = {}
+    started = time.monotonic()
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        while time.monotonic() - started < SSE_MAX_AGE:
+            for topic in topics:
+                try:
+                    snapshot = STREAM_TOPICS[topic]()
+                except Exception as e:
+                    print(f"SSE {topic} snapshot failed: {e}")
+                    continue
+                if sent.get(topic) != snapshot.etag:
+                    sent[topic] = snapshot.etag
+                    yield f"event: {topic}\ndata: {snapshot.body.decode('utf-8')}\n\n"
+
+            timeout = SSE_KEEPALIVE
+            if "messages" in topics:
+                try:
+                    timeout = min(timeout, _seconds_until_window_change() + 1)
+                except Exception:
+                    pass
+            try:
+                q.get(timeout=max(timeout, 1))
+            except queue.Empty:
+                yield ": keepalive\n\n"
+    finally:
+        broadcaster.unsubscribe(q)
+
+
+@landing_bp.route("/api/stream")
+def stream():
+    """SSE channel for greeting/PS and chronicle changes, e.g. ?topics=messages,chronicle"""
+    topics = [t for t in request.args.get("topics", "messages").split(",") if t in STREAM_TOPICS]
+    if not topics:
+        return {"success": False, "error": "unknown topics"}, 400
+
+    q = broadcaster.subscribe(limit=SSE_MAX_STREAMS)
+    if q is None:
+        # A non-200 closes the EventSource for good; the page then polls instead
+        return {"success": False, "error": "too many streams"}, 503
+
+    resp = Response(
+        _event_stream(topics, q),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    # Also release the slot if the stream is closed before it ever started
+    resp.call_on_close(lambda: broadcaster.unsubscribe(q))
+    return resp
@@ -1,30 +1,143 @@
 # main.py
 import os
+import threading
+import time
 from flask import Flask
-from admin.routes import admin_bp
-from landing.routes import landing_bp
+from werkzeug.middleware.proxy_fix import ProxyFix
 
-from chat.routes import chat_bp
+import metrics
+import supabase_client
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATE_DIR = os.path.join(BASE_DIR, "landing", "templates")
 UPLOAD_FOLDER = os.path.join(BASE_DIR, "chat", "uploads")
 
 
-app = Flask(__name__, template_folder=TEMPLATE_DIR)
-app.secret_key = "SuperSecretSessionKey"
+# ---------------- Warmup ----------------
+def _warm_supabase_client():
+    supabase_client.get_client()
 
-# ---------------- Register Blueprints ----------------
-app.register_blueprint(admin_bp)
-app.register_blueprint(landing_bp, url_prefix="/")  # "/" prefix
-app.register_blueprint(chat_bp, url_prefix="/chat") 
 
+def _warm_greeting_windows():
+    from landing.message_cache import message_cache
+    message_cache.index()
 
 
-# Ensure the folder exists
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+def _warm_chronicle_feed():
+    from landing.feed_cache import chronicle_state
+    chronicle_state()
+
+
+# Run in order on a background thread; the first query opens a pooled connection
+WARMUP_HOOKS = [
+    ("supabase client", _warm_supabase_client),
+    ("greeting windows", _warm_greeting_windows),
+    ("chronicle feed", _warm_chronicle_feed),
+]
+
+
+def run_warmup(hooks):
+    """Call each (name, fn) hook, logging how long it took; failures are only logged."""
+    for name, fn in hooks:
+        started = time.perf_counter()
+        try:
+            fn()
+            print(f"[WARMUP] {name}: {(time.perf_counter() - started) * 1000:.0f} ms (pid {os.getpid()})")
+        except Exception as e:
+            print(f"[WARMUP] {name} failed: {e}")
+
+
+def start_warmup():
+    threading.Thread(target=run_warmup, args=(WARMUP_HOOKS,), name="warmup", daemon=True).start()
+
+
+# ---------------- App Factory ----------------
+def create_app(config=None, warmup=None):
+    """
+    Build the Flask app. Nothing talks to Supabase here: the client is created
+    per worker on first use. `warmup` (default: APP_WARMUP env, on) primes the
+    client and caches in the background so the first requests don't pay for it;
+    under gunicorn that happens per worker, after fork.
+    """
+    started = time.perf_counter()
+
+    # Before importing blueprints, whose modules read settings from the environment
+    supabase_client.load_env()
+
+    from admin.routes import admin_bp
+    from landing.routes import landing_bp
+    from chat.routes import chat_bp
+    from admin.cleanup_jobs import start_retention_scheduler
+    from batch_writer import visit_writer, activity_writer
+    from landing import bot_filter
+    from landing.page_cache import page_cache
+    from chat.upload_store import DEFAULT_MAX_UPLOAD_SIZE, FORM_OVERHEAD
+    from admin.upload_jobs import CHRONICLE_MAX_UPLOAD_SIZE
+
+    app = Flask(__name__, template_folder=TEMPLATE_DIR)
+    app.secret_key = "SuperSecretSessionKey"
+    app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+    app.config["MAX_UPLOAD_SIZE"] = int(os.getenv("MAX_UPLOAD_SIZE", str(DEFAULT_MAX_UPLOAD_SIZE)))
+    # Proxies in front of the app (Render's router is one); 0 when requests arrive directly
+    app.config["PROXY_FIX_X_FOR"] = int(os.getenv("PROXY_FIX_X_FOR", "1"))
+    if config:
+        app.config.update(config)
+
+    # Werkzeug refuses larger bodies before parsing (and spooling) the multipart form;
+    # chat routes apply the tighter MAX_UPLOAD_SIZE from Content-Length
+    if app.config.get("MAX_CONTENT_LENGTH") is None:
+        app.config["MAX_CONTENT_LENGTH"] = (
+            max(app.config["MAX_UPLOAD_SIZE"], CHRONICLE_MAX_UPLOAD_SIZE) + FORM_OVERHEAD
+        )
+
+    # remote_addr becomes the client from X-Forwarded-For instead of the proxy
+    if app.config["PROXY_FIX_X_FOR"]:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_FIX_X_FOR"])
+
+    # ---------------- Register Blueprints ----------------
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(landing_bp, url_prefix="/")  # "/" prefix
+    app.register_blueprint(chat_bp, url_prefix="/chat")
+
+    # ---------------- Instrumentation ----------------
+    metrics.init_app(app)
+    metrics.add_collector("tracklink_visit_writer", lambda: visit_writer.stats)
+    metrics.add_collector("tracklink_activity_writer", lambda: activity_writer.stats)
+    metrics.add_collector("tracklink_bot_filter", lambda: bot_filter.stats)
+    metrics.add_collector("tracklink_page_cache", lambda: page_cache.stats)
+    metrics.add_collector("tracklink_supabase_pool", supabase_client.pool_stats)
+
+    # Ensure the folder exists
+    os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+
+    # Daily visits/user_activity retention (only if *_RETENTION_DAYS is set)
+    start_retention_scheduler()
+
+    if warmup is None:
+        # Under gunicorn each worker warms up from post_worker_init instead (see gunicorn.conf.py)
+        warmup = os.getenv("APP_WARMUP", "1") == "1" and os.getenv("APP_WARMUP_IN_WORKER") != "1"
+    if warmup:
+        start_warmup()
+
+    app.config["BOOT_SECONDS"] = time.perf_counter() - started
+    print(f"[BOOT] app created in {app.config['BOOT_SECONDS'] * 1000:.0f} ms (pid {os.getpid()})")
+    return app
+
+
+_app = None
+
+
+def __getattr__(name):
+    # `gunicorn main:app` still works, but importing main alone builds nothing
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(name)
+
 
 # ---------------- Run App ----------------
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    create_app().run(host="0.0.0.0", port=port, debug=True)
@@ -0,0 +1,193 @@
+# metrics.py
+"""
+In-process latency histograms, exported in Prometheus text format.
+
+Three series are recorded:
+- tracklink_request_seconds{route, method, status}
+- tracklink_supabase_seconds{table, op}
+- tracklink_template_seconds{template}
+
+Each gunicorn worker keeps its own registry, so a scrape reports the
+worker that answered it.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "tracklink_request_seconds": "HTTP request latency by route",
+    "tracklink_supabase_seconds": "Supabase call latency by table and operation",
+    "tracklink_template_seconds": "Jinja template render time",
+}
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram (Prometheus semantics)."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation (max for +Inf)."""
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return 0.0
+
+
+_series = {}
+_lock = threading.Lock()
+_collectors = {}
+
+
+def observe(metric, seconds, **labels):
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        hist = _series.get(key)
+        if hist is None:
+            hist = _series[key] = Histogram()
+        hist.observe(seconds)
+
+
+@contextmanager
+def timed(metric, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(metric, time.perf_counter() - started, **labels)
+
+
+def add_collector(prefix, fn):
+    """Export fn()'s numeric values as gauges named <prefix>_<key> on every scrape."""
+    _collectors[prefix] = fn
+
+
+def reset():
+    with _lock:
+        _series.clear()
+
+
+# ---------- Export ----------
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def prometheus_text():
+    with _lock:
+        snapshot = [
+            (metric, labels, list(h.counts), h.total, h.count)
+            for (metric, labels), h in sorted(_series.items())
+        ]
+
+    lines, described = [], set()
+    for metric, labels, counts, total, count in snapshot:
+        if metric not in described:
+            described.add(metric)
+            lines.append(f"# HELP {metric} {HELP.get(metric, metric)}")
+            lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for bound, n in zip(BUCKETS + (None,), counts):
+            cumulative += n
+            le = "+Inf" if bound is None else f"{bound:g}"
+            lines.append(f"{metric}_bucket{_label_str(labels, [('le', le)])} {cumulative}")
+        lines.append(f"{metric}_sum{_label_str(labels)} {total:.6f}")
+        lines.append(f"{metric}_count{_label_str(labels)} {count}")
+
+    for prefix, fn in list(_collectors.items()):
+        try:
+            values = fn()
+        except Exception as e:
+            print(f"[METRICS] collector {prefix} failed: {e}")
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, (bool, int, float)):
+                name = f"{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name}{_label_str([('pid', os.getpid())])} {float(value):g}")
+    return "\n".join(lines) + "\n"
+
+
+def slowest(limit=10):
+    """Series with the highest p95, for the admin dashboard."""
+    with _lock:
+        rows = [
+            {
+                "metric": metric.replace("tracklink_", "").replace("_seconds", ""),
+                "labels": " ".join(f"{k}={v}" for k, v in labels),
+                "count": h.count,
+                "mean_ms": h.total / h.count * 1000,
+                "p95_ms": h.quantile(0.95) * 1000,
+                "max_ms": h.max * 1000,
+            }
+            for (metric, labels), h in _series.items()
+            if h.count
+        ]
+    rows.sort(key=lambda r: (r["p95_ms"], r["mean_ms"]), reverse=True)
+    return rows[:limit]
+
+
+# ---------- Flask wiring ----------
+def init_app(app):
+    """Time every request and template render on this app."""
+    from flask import g, request, template_rendered, before_render_template
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_status(response):
+        g._metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _observe_request(exc):
+        started = g.pop("_metrics_started", None)
+        if started is None:
+            return
+        status = 500 if exc is not None else g.pop("_metrics_status", 500)
+        observe(
+            "tracklink_request_seconds",
+            time.perf_counter() - started,
+            route=request.url_rule.rule if request.url_rule else "unmatched",
+            method=request.method,
+            status=f"{status // 100}xx"
+        )
+
+    def _template_started(sender, template, context, **extra):
+        g.setdefault("_metrics_templates", []).append(time.perf_counter())
+
+    def _template_done(sender, template, context, **extra):
+        starts = g.get("_metrics_templates")
+        if starts:
+            observe(
+                "tracklink_template_seconds",
+                time.perf_counter() - starts.pop(),
+                template=template.name or "string"
+            )
+
+    before_render_template.connect(_template_started, app, weak=False)
+    template_rendered.connect(_template_done, app, weak=False)
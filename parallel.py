@@ -0,0 +1,81 @@
+# parallel.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", "8"))
+FANOUT_TIMEOUT = float(os.getenv("FANOUT_TIMEOUT", "10"))
+
+_RAISE = object()
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # One pool per process, created after gunicorn forks its workers
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=FANOUT_WORKERS, thread_name_prefix="supabase-fanout"
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+class FanOut:
+    """
+    Request-scoped group of independent Supabase calls.
+    - add() starts a call on the shared pool right away
+    - join() waits for all of them, so the view pays only for the slowest
+    - each call has its own timeout, clamped to the group deadline
+      (created + timeout); on failure the call's `default` is used if one
+      was given, otherwise the error is raised
+
+    A timed-out call keeps running in its pool thread; only the wait is abandoned.
+    """
+
+    def __init__(self, timeout=FANOUT_TIMEOUT):
+        self.timeout = timeout
+        self._started = time.monotonic()
+        self._calls = {}
+
+    def add(self, name, fn, *args, timeout=None, default=_RAISE, **kwargs):
+        future = _get_executor().submit(fn, *args, **kwargs)
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        # Never wait past the group's own deadline, however late the call was added
+        self._calls[name] = (future, min(deadline, self._started + self.timeout), default)
+        return self
+
+    def join(self):
+        results = {}
+        for name, (future, deadline, default) in self._calls.items():
+            try:
+                results[name] = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except FutureTimeout:
+                if default is _RAISE:
+                    raise TimeoutError(f"Call '{name}' timed out")
+                print(f"[FANOUT] {name} timed out, using default")
+                results[name] = default
+            except Exception as e:
+                if default is _RAISE:
+                    raise
+                print(f"[FANOUT] {name} failed: {e}")
+                results[name] = default
+        return results
+
+
+def fan_out(calls, timeout=FANOUT_TIMEOUT):
+    """
+    Run independent zero-argument callables concurrently and join them.
+    `calls` maps a name to a callable; returns {name: result}.
+    The first exception (or a timeout) is re-raised to the caller.
+    """
+    group = FanOut(timeout)
+    for name, fn in calls.items():
+        group.add(name, fn)
+    return group.join()
@@ -1,21 +1,307 @@
 # supabase_client.py
-from supabase import create_client, Client
 import os
+import random
+import threading
+import time
+from typing import TYPE_CHECKING
+
+import httpx
 from dotenv import load_dotenv
 
-# Load local .env for development only
-load_dotenv()  # safe to call even if .env doesn't exist
+import metrics
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+_env_loaded = False
+
+
+def load_env():
+    """Load local .env once (development only; safe if the file doesn't exist)."""
+    global _env_loaded
+    if not _env_loaded:
+        load_dotenv()
+        _env_loaded = True
+
+
+def _env_int(name, default):
+    load_env()
+    return int(os.getenv(name, default))
+
+
+def _env_float(name, default):
+    load_env()
+    return float(os.getenv(name, default))
+
+
+def credentials():
+    """
+    (SUPABASE_URL, SUPABASE_KEY). Checked when a client is first needed rather
+    than at import, so importing the app never fails on missing env vars.
+    """
+    load_env()
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        raise RuntimeError(
+            "Supabase environment variables are missing! "
+            "Set SUPABASE_URL and SUPABASE_KEY either in .env (local) or Render environment."
+        )
+    return url, key
+
+
+RETRY_METHODS = {"GET", "HEAD", "OPTIONS"}
+RETRY_STATUSES = {502, 503, 504}
+
+
+# ---------- Transport ----------
+class PooledTransport(httpx.BaseTransport):
+    """
+    httpx transport with a bounded keep-alive pool, retries and usage counters.
+    - Connection errors are retried for any method (nothing reached the server)
+    - Read errors and 502/503/504 are retried for idempotent methods only
+    - Backoff is exponential with full jitter
+    """
+
+    def __init__(self):
+        # Settings are per gunicorn worker process
+        self.max_connections = _env_int("SUPABASE_POOL_SIZE", "20")
+        self.http2 = os.getenv("SUPABASE_HTTP2", "0") == "1"
+        self.max_retries = _env_int("SUPABASE_RETRIES", "2")
+        self.retry_backoff = _env_float("SUPABASE_RETRY_BACKOFF", "0.2")
 
-# Get environment variables
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=_env_int("SUPABASE_POOL_KEEPALIVE", "10"),
+            keepalive_expiry=_env_float("SUPABASE_KEEPALIVE_EXPIRY", "60"),
+        )
+        try:
+            self._inner = httpx.HTTPTransport(limits=limits, http2=self.http2)
+        except ImportError:
+            # http2=True needs the optional `h2` package
+            print("HTTP/2 requested but h2 is not installed; using HTTP/1.1")
+            self._inner = httpx.HTTPTransport(limits=limits)
 
-# Fail fast if not set
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError(
-        "Supabase environment variables are missing! "
-        "Set SUPABASE_URL and SUPABASE_KEY either in .env (local) or Render environment."
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "retries": 0,
+            "errors": 0,
+            "in_flight": 0,
+            "peak_in_flight": 0,
+        }
+
+    def _track(self, delta):
+        with self._lock:
+            self.stats["in_flight"] += delta
+            if delta > 0:
+                self.stats["requests"] += 1
+                self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+
+    def _sleep_before_retry(self, attempt):
+        with self._lock:
+            self.stats["retries"] += 1
+        time.sleep(random.uniform(0, self.retry_backoff * (2 ** attempt)))
+
+    def handle_request(self, request):
+        idempotent = request.method in RETRY_METHODS
+        self._track(1)
+        try:
+            for attempt in range(self.max_retries + 1):
+                last_attempt = attempt == self.max_retries
+                try:
+                    response = self._inner.handle_request(request)
+                except httpx.ConnectError:
+                    if last_attempt:
+                        raise
+                except (httpx.ReadError, httpx.ReadTimeout, httpx.RemoteProtocolError):
+                    if last_attempt or not idempotent:
+                        raise
+                else:
+                    if idempotent and response.status_code in RETRY_STATUSES and not last_attempt:
+                        response.close()
+                    else:
+                        return response
+                self._sleep_before_retry(attempt)
+        except Exception:
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            self._track(-1)
+
+    def open_connections(self):
+        # httpcore's pool is private; report what we can
+        pool = getattr(self._inner, "_pool", None)
+        return len(getattr(pool, "connections", []) or [])
+
+    def close(self):
+        self._inner.close()
+
+
+# ---------- Client factory ----------
+def create_supabase_client():
+    """Build a Supabase client whose PostgREST/storage calls share one pooled httpx client."""
+    # supabase-py pulls in postgrest, storage, auth and realtime; only pay for it here
+    from supabase import create_client, ClientOptions
+
+    url, key = credentials()
+    request_timeout = _env_float("SUPABASE_TIMEOUT", "15")
+    transport = PooledTransport()
+    http_client = httpx.Client(
+        transport=transport,
+        timeout=httpx.Timeout(request_timeout, connect=_env_float("SUPABASE_CONNECT_TIMEOUT", "5")),
     )
+    try:
+        options = ClientOptions(
+            postgrest_client_timeout=request_timeout,
+            storage_client_timeout=int(request_timeout),
+            httpx_client=http_client,
+        )
+    except TypeError:
+        # Older supabase-py without `httpx_client`: only timeouts can be tuned
+        options = ClientOptions(
+            postgrest_client_timeout=request_timeout,
+            storage_client_timeout=int(request_timeout),
+        )
+    client = create_client(url, key, options=options)
+    return client, transport
+
+
+_client = None
+_transport = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> "Client":
+    """The Supabase client for this process (rebuilt in each forked worker)."""
+    global _client, _transport, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client, _transport = create_supabase_client()
+                _client_pid = os.getpid()
+    return _client
+
+
+def install_client(client):
+    """Use `client` for this process instead of building one (e.g. the benchmark's fake)."""
+    global _client, _transport, _client_pid
+    with _client_lock:
+        _client, _transport, _client_pid = client, None, os.getpid()
+
+
+def _reset_after_fork():
+    # Never reuse sockets inherited from the parent process
+    global _client, _transport, _client_pid, _client_lock
+    _client, _transport, _client_pid = None, None, None
+    _client_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def pool_stats():
+    """Connection pool utilization for this worker process."""
+    if _transport is None or _client_pid != os.getpid():
+        return {"max_connections": _env_int("SUPABASE_POOL_SIZE", "20"), "initialized": False}
+    with _transport._lock:
+        stats = dict(_transport.stats)
+    stats.update({
+        "initialized": True,
+        "pid": _client_pid,
+        "http2": _transport.http2,
+        "max_connections": _transport.max_connections,
+        "open_connections": _transport.open_connections(),
+        "utilization": stats["in_flight"] / _transport.max_connections,
+    })
+    return stats
+
+
+# ---------- Filter values ----------
+def quote_filter_value(value):
+    """Double-quote a value for a PostgREST filter string (or=, in.(...)), escaping backslashes and quotes."""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+# ---------- Latency tracing ----------
+class _TracedQuery:
+    """Wraps a PostgREST builder so .execute() is timed per table and operation."""
+
+    OPS = {"select", "insert", "update", "upsert", "delete"}
+
+    def __init__(self, builder, table, op):
+        self._builder = builder
+        self._table = table
+        self._op = op
+
+    def execute(self, *args, **kwargs):
+        with metrics.timed("tracklink_supabase_seconds", table=self._table, op=self._op):
+            return self._builder.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        op = name if name in self.OPS else self._op
+        if not callable(attr):
+            # e.g. the `.not_` modifier, which returns a builder
+            return _TracedQuery(attr, self._table, op) if hasattr(attr, "execute") else attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return _TracedQuery(result, self._table, op) if hasattr(result, "execute") else result
+        return call
+
+
+class _TracedBucket:
+    """Times storage calls (upload, remove, ...) per bucket."""
+
+    def __init__(self, bucket, name):
+        self._bucket = bucket
+        self._name = name
+
+    def __getattr__(self, name):
+        attr = getattr(self._bucket, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with metrics.timed("tracklink_supabase_seconds", table=f"storage:{self._name}", op=name):
+                return attr(*args, **kwargs)
+        return call
+
+
+class _TracedStorage:
+    def __init__(self, storage):
+        self._storage = storage
+
+    def from_(self, bucket):
+        return _TracedBucket(self._storage.from_(bucket), bucket)
+
+    def __getattr__(self, name):
+        return getattr(self._storage, name)
+
+
+class _ClientProxy:
+    """
+    Keeps `from supabase_client import supabase` working while the real client
+    is per process, and times every table, rpc and storage call.
+    """
+
+    def table(self, name):
+        return _TracedQuery(get_client().table(name), name, "query")
+
+    def rpc(self, fn, params=None, *args, **kwargs):
+        return _TracedQuery(get_client().rpc(fn, params or {}, *args, **kwargs), f"rpc:{fn}", "rpc")
+
+    @property
+    def storage(self):
+        return _TracedStorage(get_client().storage)
+
+    def __getattr__(self, name):
+        return getattr(get_client(), name)
+
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Nothing is built until the first attribute access in each process
+supabase: "Client" = _ClientProxy()